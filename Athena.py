@@ -4,22 +4,406 @@ import yt_dlp as youtube_dl  # Use yt-dlp instead of youtube_dl
 import asyncio
 import time
 import re
-from collections import defaultdict, deque
+import os
+from collections import deque, OrderedDict
+from itertools import islice
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor
+import multiprocessing
+import threading
+import signal
+import subprocess
+import sys
+import argparse
+import sqlite3
+import unicodedata
 import random
+import contextvars
+import json
+from bisect import bisect_left
+import heapq
 
 
 # Define intents
 intents = discord.Intents.default()
 intents.message_content = True
-looping = False
-current_title = None
-current_duration = None
-current_webpage_url = None
-current_thumbnail = None
-current_requester_id = None
-search_results = {}
-volume = 1.0
-queues = defaultdict(deque)
+
+
+# --- queue ---
+
+class Track:
+    """One queued song."""
+
+    __slots__ = ("url", "title", "requester_id", "duration", "queued", "key")
+
+    def __init__(self, url: str, title: str | None, requester_id: int | None, duration: float | None = None):
+        self.url = url
+        self.title = title
+        self.requester_id = requester_id
+        self.duration = duration
+        self.queued = False  # set while the track sits in a TrackQueue
+        self.key = 0.0       # sort key within its queue; the saved row's `pos`
+
+
+class _Node:
+    __slots__ = ("track", "prio", "left", "right", "size")
+
+    def __init__(self, track: Track):
+        self.track = track
+        self.prio = random.random()
+        self.left = None
+        self.right = None
+        self.size = 1
+
+
+def _size(node):
+    return node.size if node else 0
+
+def _fix(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+def _merge(a, b):
+    if not a:
+        return b
+    if not b:
+        return a
+    if a.prio > b.prio:
+        a.right = _merge(a.right, b)
+        _fix(a)
+        return a
+    b.left = _merge(a, b.left)
+    _fix(b)
+    return b
+
+def _split(node, k):
+    """(first k nodes, the rest)."""
+    if not node:
+        return None, None
+    if _size(node.left) >= k:
+        left, node.left = _split(node.left, k)
+        _fix(node)
+        return left, node
+    node.right, right = _split(node.right, k - _size(node.left) - 1)
+    _fix(node)
+    return node, right
+
+
+class TrackQueue:
+    """
+    Positional queue of Tracks backed by an implicit treap: index, insert, pop and
+    slicing are O(log n), so huge merged playlists stay cheap to edit and page
+    through. Keeps a running total of known durations.
+    With `journal=True` it also records its mutations (see take_journal), so the
+    durable state can save a queue edit without rewriting the whole queue.
+    """
+
+    def __init__(self, tracks=(), journal: bool = False):
+        self._root = None
+        self.total_duration = 0.0  # sum of known durations
+        self.unknown = 0           # tracks whose duration isn't known yet
+        self.journal = [] if journal else None  # ("put", Track) / ("del", key) since the last take
+        self.rewrite = False                    # the journal was given up on; save everything
+        self._rebuild(list(tracks))
+
+    def __len__(self):
+        return _size(self._root)
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def __getitem__(self, index: int) -> Track:
+        node, index = self._root, self._index(index)
+        while True:
+            left = _size(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node.track
+            else:
+                index -= left + 1
+                node = node.right
+
+    def _index(self, index: int) -> int:
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("queue index out of range")
+        return index
+
+    def _added(self, track: Track):
+        track.queued = True
+        if track.duration is None:
+            self.unknown += 1
+        else:
+            self.total_duration += track.duration
+
+    def _removed(self, track: Track):
+        track.queued = False
+        if track.duration is None:
+            self.unknown -= 1
+        else:
+            self.total_duration -= track.duration
+
+    def _log(self, op: str, arg):
+        if self.journal is not None and not self.rewrite:
+            self.journal.append((op, arg))
+
+    def _rewrite(self):
+        if self.journal is not None:
+            self.journal.clear()
+            self.rewrite = True
+
+    def take_journal(self):
+        """(save everything?, mutations since the last call) and start a new journal."""
+        ops, rewrite = self.journal or [], self.rewrite or len(self.journal or ()) > len(self)
+        if self.journal is not None:
+            self.journal, self.rewrite = [], False
+        return rewrite, ops
+
+    def _rebuild(self, tracks):
+        """O(n) Cartesian-tree build from a list, in order."""
+        stack = []
+        self._rewrite()
+        for i, track in enumerate(tracks):
+            self._added(track)
+            track.key = float(i)
+            node = _Node(track)
+            last = None
+            while stack and stack[-1].prio < node.prio:
+                last = stack.pop()
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        self._root = stack[0] if stack else None
+        # sizes bottom-up (iterative post-order)
+        todo, order = [self._root] if self._root else [], []
+        while todo:
+            node = todo.pop()
+            order.append(node)
+            todo.extend(c for c in (node.left, node.right) if c)
+        for node in reversed(order):
+            _fix(node)
+
+    def iter_from(self, start: int):
+        """Tracks from position `start` onwards (O(log n) to find the start)."""
+        stack, node, k = [], self._root, start
+        while node:
+            left = _size(node.left)
+            if k < left:
+                stack.append(node)
+                node = node.left
+            elif k == left:
+                stack.append(node)
+                break
+            else:
+                k -= left + 1
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node.track
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+
+    def slice(self, start: int, stop: int) -> list:
+        return list(islice(self.iter_from(max(0, start)), max(0, stop - max(0, start))))
+
+    def append(self, track: Track):
+        track.key = self[-1].key + 1.0 if self._root else 0.0
+        self._added(track)
+        self._root = _merge(self._root, _Node(track))
+        self._log("put", track)
+
+    def insert(self, index: int, track: Track):
+        index = _clamp(index, 0, len(self))
+        before = self[index - 1].key if index > 0 else None
+        after = self[index].key if index < len(self) else None
+        if before is None:
+            track.key = after - 1.0 if after is not None else 0.0
+        elif after is None:
+            track.key = before + 1.0
+        else:
+            track.key = (before + after) / 2
+        left, right = _split(self._root, index)
+        self._added(track)
+        self._root = _merge(_merge(left, _Node(track)), right)
+        if before is not None and after is not None and not before < track.key < after:
+            tracks = list(self)  # ran out of float precision between neighbours: renumber
+            self.clear()
+            self._rebuild(tracks)
+        else:
+            self._log("put", track)
+
+    def pop(self, index: int = -1) -> Track:
+        index = self._index(index)
+        left, rest = _split(self._root, index)
+        mid, right = _split(rest, 1)
+        self._root = _merge(left, right)
+        self._removed(mid.track)
+        self._log("del", mid.track.key)
+        return mid.track
+
+    def popleft(self) -> Track:
+        return self.pop(0)
+
+    def drop_front(self, count: int):
+        """Remove the first `count` tracks."""
+        dropped, self._root = _split(self._root, count)
+        todo = [dropped] if dropped else []
+        while todo:
+            node = todo.pop()
+            self._removed(node.track)
+            self._log("del", node.track.key)
+            todo.extend(c for c in (node.left, node.right) if c)
+
+    def clear(self):
+        for track in self:
+            track.queued = False
+        self._root = None
+        self.total_duration = 0.0
+        self.unknown = 0
+        self._rewrite()
+
+    def shuffle(self):
+        tracks = list(self)
+        random.shuffle(tracks)
+        self.clear()
+        self._rebuild(tracks)
+
+    def set_duration(self, track: Track, duration: float | None):
+        """Update a track's duration, keeping the running total right."""
+        if track.queued:
+            self._removed(track)
+            track.duration = duration
+            self._added(track)
+            self._log("put", track)
+        else:
+            track.duration = duration
+
+
+class GuildPlayer:
+    """Everything playback-related for one guild. Owned by `players`."""
+
+    __slots__ = (
+        "guild_id", "queue", "looping", "volume",
+        "title", "duration", "webpage_url", "thumbnail", "requester_id",
+        "prefetch", "lock", "generation", "text_channel_id", "source",
+        "watchdog", "refreshes", "idle_since", "ended_at",
+    )
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.queue = TrackQueue(journal=bool(STATE_DB))
+        self.looping = False
+        self.volume = 1.0
+        self.title = None
+        self.duration = None
+        self.webpage_url = None
+        self.thumbnail = None
+        self.requester_id = None
+        self.prefetch = None            # (asyncio.Task, urls) while warming the queue head
+        self.lock = asyncio.Lock()      # serializes voice connects
+        self.generation = 0             # bumped on every (re)start so stale after() callbacks are ignored
+        self.text_channel_id = None     # where playback commands were last issued
+        self.source = None              # TrackedSource of the current ffmpeg process
+        self.watchdog = None            # asyncio.Task watching the current stream
+        self.refreshes = 0              # fresh-URL restarts used up on the current track
+        self.idle_since = None          # time.monotonic() the reaper first saw this guild idle
+        self.ended_at = None            # time.monotonic() the last track finished, until the next one sounds
+
+    def position(self) -> float:
+        """Seconds into the current track, from the frames actually sent to Discord."""
+        return self.source.position if self.source else 0.0
+
+
+players = {}  # guild_id -> GuildPlayer
+
+
+def get_player(guild_id: int) -> GuildPlayer:
+    player = players.get(guild_id)
+    if player is None:
+        player = players[guild_id] = GuildPlayer(guild_id)
+    return player
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# --- metrics ---
+# In-process counters and fixed-bucket latency histograms, cheap enough to record
+# on every call. Exported as Prometheus text on ATHENA_METRICS_PORT, as a JSON file
+# rewritten every ATHENA_METRICS_JSON_INTERVAL seconds, and through &stats.
+METRICS_HOST = os.environ.get("ATHENA_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = _env_int("ATHENA_METRICS_PORT", 0)          # 0 = no HTTP endpoint
+METRICS_JSON = os.environ.get("ATHENA_METRICS_JSON", "")    # empty = no JSON dump
+METRICS_JSON_INTERVAL = _env_float("ATHENA_METRICS_JSON_INTERVAL", 60.0)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# which command/task an extraction is for ("play", "seek", "hydrate"...); set at
+# the top of each entry point and inherited by everything it awaits
+_call_site = contextvars.ContextVar("call_site", default="other")
+
+
+class Histogram:
+    """Counts per LATENCY_BUCKETS bucket (plus +Inf), with sum and count."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-quantile, None when empty."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+
+
+class Metrics:
+    """Named counters/histograms keyed by (name, sorted label pairs). Loop thread only."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name: str, n: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram()
+        hist.observe(value)
+
+
+metrics = Metrics()
 
 
 YDL_SEARCH_OPTS = {
@@ -30,24 +414,1307 @@ YDL_SEARCH_OPTS = {
     "extractor_args": {"youtube": {"player_client": ["android"]}},
 }
 
+YDL_PLAYLIST_OPTS = {
+    **YDL_SEARCH_OPTS,
+    "noplaylist": False,                  # allow playlist extraction here
+    "extract_flat": "in_playlist",       # no stream links; fast
+    "quiet": True,
+}
+
+YDL_SEARCH5_OPTS = {**YDL_SEARCH_OPTS, "default_search": "ytsearch5"}
+
+# Opus mode wants YouTube's native Opus (itag 251) so ffmpeg can pass it through.
+YDL_OPUS_OPTS = {**YDL_SEARCH_OPTS, "format": "bestaudio[acodec=opus]/bestaudio[ext=webm]/bestaudio/best"}
+
+# "pcm": ffmpeg -> PCM -> PCMVolumeTransformer -> libopus in-process (original path)
+# "opus": ffmpeg hands discord.py Opus packets directly; copied untouched at 100%
+#         volume, otherwise gain is applied by ffmpeg and it re-encodes.
+PLAYBACK_MODE = os.environ.get("ATHENA_PLAYBACK_MODE", "pcm")
+
+# Named option sets; warm YoutubeDL instances are kept per profile.
+YDL_PROFILES = {
+    "stream": YDL_SEARCH_OPTS,
+    "playlist": YDL_PLAYLIST_OPTS,
+    "search": YDL_SEARCH5_OPTS,
+    "stream_opus": YDL_OPUS_OPTS,
+}
+STREAM_PROFILE = "stream_opus" if PLAYBACK_MODE == "opus" else "stream"
+
+# --- extraction service ---
+# yt-dlp is fully blocking (network + player JS), so every extract_info goes
+# through one bounded pool instead of running on the event loop.
+EXTRACT_BACKEND = os.environ.get("ATHENA_EXTRACT_BACKEND", "thread")  # "thread" or "process"
+EXTRACT_WORKERS = _env_int("ATHENA_EXTRACT_WORKERS", 4)              # threads/processes in the pool
+EXTRACT_CONCURRENCY = _env_int("ATHENA_EXTRACT_CONCURRENCY", EXTRACT_WORKERS)  # extractions in flight
+EXTRACT_TIMEOUT = _env_float("ATHENA_EXTRACT_TIMEOUT", 30.0)         # seconds per call
+HYDRATE_CONCURRENCY = _env_int("ATHENA_HYDRATE_CONCURRENCY", 1)      # background metadata lookups
+
+_extract_executor = None
+_background_executor = None
+_extract_slots = asyncio.Semaphore(EXTRACT_CONCURRENCY)
+# Background work gets its own slots *and* its own pool, so it can never occupy
+# capacity (or a place in the pool's queue) that play/search are waiting for.
+_background_slots = asyncio.Semaphore(HYDRATE_CONCURRENCY)
+_ydl_local = threading.local()  # per worker thread (or process): profile -> YoutubeDL
+
+# Only these fields cross the pool boundary; full info dicts are huge.
+_INFO_FIELDS = ("id", "url", "webpage_url", "title", "duration", "thumbnail",
+                "http_headers", "uploader", "channel", "acodec", "ext")
+_ENTRY_FIELDS = ("id", "url", "webpage_url", "title", "duration", "thumbnail", "uploader", "channel")
+
+
+class ExtractionError(Exception):
+    pass
+
+class ExtractionTimeout(ExtractionError):
+    pass
+
+
+def _get_ydl(profile: str):
+    ydls = getattr(_ydl_local, "ydls", None)
+    if ydls is None:
+        ydls = _ydl_local.ydls = {}
+    ydl = ydls.get(profile)
+    if ydl is None:
+        ydl = ydls[profile] = youtube_dl.YoutubeDL(YDL_PROFILES[profile])
+    return ydl
+
+def _slim_info(info: dict | None):
+    """Reduce a yt-dlp info dict to the handful of fields the bot reads."""
+    if not info:
+        return info
+    out = {k: info[k] for k in _INFO_FIELDS if info.get(k) is not None}
+    if not out.get("thumbnail") and info.get("thumbnails"):
+        out["thumbnail"] = info["thumbnails"][-1].get("url")
+    entries = info.get("entries")
+    if entries is not None:
+        out["entries"] = [
+            {k: e[k] for k in _ENTRY_FIELDS if e.get(k) is not None}
+            for e in entries if e
+        ]
+    return out
+
+def _extract_blocking(url: str, profile: str):
+    try:
+        return _slim_info(_get_ydl(profile).extract_info(url, download=False))
+    except Exception as e:
+        # yt-dlp errors don't always pickle; keep just the message
+        raise ExtractionError(str(e)) from None
+
+def _extract_worker_init():
+    # Worker processes: leave Ctrl+C to the parent and warm every profile up front.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for profile in YDL_PROFILES:
+        _get_ydl(profile)
+
+def _new_extract_executor(workers: int, name: str):
+    if EXTRACT_BACKEND == "process":
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_extract_worker_init,
+        )
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+def _get_extract_executor(background: bool = False):
+    global _extract_executor, _background_executor
+    if background:
+        if _background_executor is None:
+            _background_executor = _new_extract_executor(max(1, HYDRATE_CONCURRENCY), "ytdlp-bg")
+        return _background_executor
+    if _extract_executor is None:
+        _extract_executor = _new_extract_executor(EXTRACT_WORKERS, "ytdlp")
+    return _extract_executor
+
+# Concurrent requests for the same video/query share one extraction.
+_inflight = {}  # (profile, canonical url) -> [asyncio.Task, number of waiters]
+
+
+def _flight_key(url: str, profile: str):
+    if profile in ("stream", "stream_opus"):
+        # every URL form of a video (youtu.be, &t=, &list=...) resolves the same
+        return (profile, _video_id(url) or url.strip())
+    return (profile, url.strip())
+
+async def extract_info(url: str, profile: str = "stream", *, timeout: float | None = EXTRACT_TIMEOUT,
+                       background: bool = False):
+    """
+    Run a yt-dlp extraction on the extraction pool without blocking the loop.
+    Returns the slimmed info dict (see _slim_info); it is shared between
+    coalesced callers, so treat it as read-only.
+    Callers asking for the same video (or query) while an extraction is in flight
+    await that one instead of starting another; it is only cancelled once every
+    caller has gone. A job that is already running can't be interrupted, so it
+    finishes in the background (still holding its slot) and its result is
+    discarded. Raises ExtractionTimeout after `timeout` seconds, counting the
+    wait for a slot.
+    `background=True` is for low-priority work (hydration) and uses the
+    separate background budget instead of the foreground one.
+    """
+    key = _flight_key(url, profile)
+    site = _call_site.get()
+    flight = _inflight.get(key)
+    if flight is None:
+        task = asyncio.get_running_loop().create_task(_extract_once(url, profile, timeout, background))
+        flight = _inflight[key] = [task, 0]
+        task.add_done_callback(lambda _t: _inflight.pop(key, None))
+    else:
+        metrics.inc("extract_coalesced_total", profile=profile)
+    flight[1] += 1
+    started = time.monotonic()
+    try:
+        info = await asyncio.shield(flight[0])
+    except asyncio.CancelledError:
+        if flight[1] == 1:
+            flight[0].cancel()  # nobody else wants it
+        raise
+    except Exception:
+        metrics.inc("extract_errors_total", site=site, profile=profile)
+        raise
+    finally:
+        flight[1] -= 1
+    metrics.observe("extract_seconds", time.monotonic() - started, site=site, profile=profile)
+    return info
+
+async def _extract_once(url: str, profile: str, timeout: float | None, background: bool):
+    try:
+        return await asyncio.wait_for(_extract_in_slot(url, profile, background), timeout)
+    except asyncio.TimeoutError:
+        raise ExtractionTimeout(f"extraction timed out after {timeout:g}s") from None
+
+def _release_slot(slots: asyncio.Semaphore, fut: asyncio.Future):
+    if not fut.cancelled():
+        fut.exception()  # retrieved here, so an abandoned job's error isn't logged as unhandled
+    slots.release()
+
+async def _extract_in_slot(url: str, profile: str, background: bool):
+    global _extract_executor, _background_executor
+    slots = _background_slots if background else _extract_slots
+    await slots.acquire()
+    try:
+        fut = asyncio.get_running_loop().run_in_executor(
+            _get_extract_executor(background), _extract_blocking, url, profile)
+    except BaseException:
+        slots.release()
+        raise
+    # the slot is held until the job really ends, not just until its caller stops waiting
+    fut.add_done_callback(lambda f: _release_slot(slots, f))
+    try:
+        return await asyncio.shield(fut)
+    except BrokenExecutor:
+        # a worker process died; start a fresh pool for the next caller
+        if background:
+            _background_executor = None
+        else:
+            _extract_executor = None
+        raise ExtractionError("extraction worker crashed, please retry") from None
+
+
+class TTLCache:
+    """Size-bounded LRU whose entries may also carry an absolute expiry (time.time())."""
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at | None, value)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, expires_at: float | None = None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def purge(self):
+        """Drop every expired entry."""
+        now = time.time()
+        for key in [k for k, (exp, _) in self._data.items() if exp is not None and exp <= now]:
+            del self._data[key]
+
+
+# --- stream URL cache ---
+# Direct googlevideo URLs stay valid for hours (see their expire= param), so seek,
+# loop and re-queues reuse them instead of running a full extraction again.
+STREAM_CACHE_SIZE = _env_int("ATHENA_STREAM_CACHE_SIZE", 512)
+STREAM_CACHE_TTL = _env_float("ATHENA_STREAM_CACHE_TTL", 1800.0)  # when the URL has no expire=
+STREAM_EXPIRY_MARGIN = 600  # never hand out a URL that dies within this many seconds
+
+stream_cache = TTLCache(STREAM_CACHE_SIZE)
+
+
+def _stream_expiry(stream_url: str | None):
+    """Absolute expiry for a stream URL, from `expire=` (query or /expire/<ts>/ path)."""
+    if not stream_url:
+        return None
+    parsed = urlparse(stream_url)
+    raw = (parse_qs(parsed.query).get("expire") or [None])[0]
+    if raw is None:
+        m = re.search(r"/expire/(\d+)", parsed.path)
+        raw = m.group(1) if m else None
+    if raw is None or not raw.isdigit():
+        return time.time() + STREAM_CACHE_TTL
+    return int(raw) - STREAM_EXPIRY_MARGIN
+
+def _open_db(path: str) -> sqlite3.Connection:
+    """SQLite connection tuned for a small local cache shared by threads (and shards)."""
+    db = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+# --- video metadata ---
+# Stable per-video facts (title, duration, thumbnail) keyed by YouTube video ID,
+# learned from every full extraction and from background hydration. An in-memory
+# LRU sits in front of an SQLite table so the cache survives restarts. The event
+# loop only ever reads the LRU (get); misses go to SQLite in one batched query on
+# the executor (fetch), and writes are buffered and flushed by _cache_flusher().
+CACHE_DB = os.environ.get("ATHENA_CACHE_DB", "athena_cache.db")  # empty string = memory only
+VIDEO_META_SIZE = _env_int("ATHENA_VIDEO_META_SIZE", 20000)        # entries kept in memory
+VIDEO_META_TTL = _env_float("ATHENA_VIDEO_META_TTL", 30 * 86400.0)  # seconds
+VIDEO_META_MAX_ROWS = _env_int("ATHENA_VIDEO_META_MAX_ROWS", 200000)
+CACHE_FLUSH_INTERVAL = 5.0
+_VIDEO_ID_RE = re.compile(r"(?:v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})")
+
+
+class MetaCache:
+    """video_id -> {title, duration, thumbnail, webpage_url}, memory LRU over SQLite."""
+
+    _FIELDS = ("title", "duration", "thumbnail", "webpage_url")
+
+    def __init__(self, path: str, maxsize: int, ttl: float, max_rows: int):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._mem = TTLCache(maxsize, ttl)
+        self._dirty = {}       # video_id -> meta not yet written
+        self._touched = set()  # video_ids read since the last flush
+        self._lock = threading.Lock()
+        self._path = path
+        self._db = None  # opened on first use, so importing the module stays cheap
+
+    def _conn(self):
+        if self._db is None and self._path:
+            self._db = _open_db(self._path)
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS video_meta ("
+                    " id TEXT PRIMARY KEY, title TEXT, duration REAL, thumbnail TEXT,"
+                    " webpage_url TEXT, updated_at REAL, accessed_at REAL)"
+                )
+                # the flush prunes by these; without them every flush scans the table
+                self._db.execute("CREATE INDEX IF NOT EXISTS video_meta_updated ON video_meta (updated_at)")
+                self._db.execute("CREATE INDEX IF NOT EXISTS video_meta_accessed ON video_meta (accessed_at)")
+        return self._db
+
+    def get(self, vid: str | None):
+        """Memory only, so it's safe on the event loop; see fetch() for the SQLite fallback."""
+        if not vid:
+            return None
+        meta = self._mem.get(vid)
+        if meta is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched.add(vid)
+        return meta
+
+    def _read_rows(self, vids: list) -> list:
+        rows = []
+        with self._lock:
+            db = self._conn()
+            for i in range(0, len(vids), 500):  # stay under SQLite's bound-variable limit
+                chunk = vids[i:i + 500]
+                rows += db.execute(
+                    "SELECT id, title, duration, thumbnail, webpage_url, updated_at FROM video_meta"
+                    f" WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+        return rows
+
+    async def fetch(self, vids) -> dict:
+        """video_id -> meta for the known ones among `vids`; one SQLite query (off the loop) for memory misses."""
+        found, missing = {}, []
+        for vid in dict.fromkeys(v for v in vids if v):
+            meta = self._mem.get(vid)
+            if meta is None:
+                missing.append(vid)
+            else:
+                found[vid] = meta
+        if missing and self._path:
+            rows = await asyncio.get_running_loop().run_in_executor(None, self._read_rows, missing)
+            now = time.time()
+            for vid, *fields, updated_at in rows:
+                if updated_at + self.ttl > now:
+                    found[vid] = dict(zip(self._FIELDS, fields))
+                    self._mem.set(vid, found[vid], expires_at=updated_at + self.ttl)
+        self.hits += len(found)
+        self.misses += len(set(vids) - set(found) - {None})
+        self._touched.update(found)
+        return found
+
+    def set(self, vid: str, meta: dict):
+        self._mem.set(vid, meta)
+        self._dirty[vid] = meta
+
+    def flush(self):
+        """Write buffered entries and prune expired/excess rows. Blocking; run off the loop."""
+        dirty, self._dirty = self._dirty, {}
+        touched, self._touched = self._touched, set()
+        if not self._path or not (dirty or touched):
+            return
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO video_meta VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(vid, *(m.get(f) for f in self._FIELDS), now, now) for vid, m in dirty.items()],
+                )
+                db.executemany(
+                    "UPDATE video_meta SET accessed_at = ? WHERE id = ?", [(now, vid) for vid in touched]
+                )
+                db.execute("DELETE FROM video_meta WHERE updated_at < ?", (now - self.ttl,))
+                excess = db.execute("SELECT COUNT(*) FROM video_meta").fetchone()[0] - self.max_rows
+                if excess > 0:
+                    db.execute(
+                        "DELETE FROM video_meta WHERE id IN"
+                        " (SELECT id FROM video_meta ORDER BY accessed_at LIMIT ?)",
+                        (excess,),
+                    )
+
+
+video_meta = MetaCache(CACHE_DB, VIDEO_META_SIZE, VIDEO_META_TTL, VIDEO_META_MAX_ROWS)
+_cache_flusher_task = None
+
+
+async def _cache_flusher():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(CACHE_FLUSH_INTERVAL)
+        try:
+            await loop.run_in_executor(None, video_meta.flush)
+        except Exception as e:
+            print(f"[cache] flush failed: {e}")
+
+
+def _video_id(url: str | None):
+    """Canonical YouTube video ID for a URL (or a bare ID), else None."""
+    if not url:
+        return None
+    m = _VIDEO_ID_RE.search(url)
+    if m:
+        return m.group(1)
+    return url if re.fullmatch(r"[A-Za-z0-9_-]{11}", url) else None
+
+def _remember_meta(info: dict, url: str | None = None):
+    """Record the stable metadata from a full extraction; returns the stored dict."""
+    vid = _video_id(info.get("webpage_url") or url) or _video_id(info.get("id"))
+    if not vid:
+        return None
+    meta = {
+        "title": info.get("title"),
+        "duration": info.get("duration"),
+        "thumbnail": info.get("thumbnail"),
+        "webpage_url": info.get("webpage_url") or url,
+    }
+    video_meta.set(vid, meta)
+    return meta
+
+async def resolve_stream(url: str, profile: str | None = None):
+    """
+    Info dict with a playable `url` + `http_headers` for a page URL, served from
+    the stream cache while the direct URL is still valid.
+    """
+    profile = profile or STREAM_PROFILE
+    info = stream_cache.get((url, profile))
+    if info is not None:
+        return info
+    info = await extract_info(url, profile)
+    _remember_meta(info, url)
+    expires_at = _stream_expiry(info.get("url"))
+    if expires_at is not None and expires_at <= time.time():
+        return info  # already too close to expiry to be worth caching
+    stream_cache.set((url, profile), info, expires_at)
+    page = info.get("webpage_url")
+    if page and page != url:
+        stream_cache.set((page, profile), info, expires_at)
+    return info
+
+
+# --- search cache ---
+# Identical searches (after normalization) within SEARCH_CACHE_TTL are served from
+# memory. Each user's last results for &pick live in a bounded, expiring store.
+SEARCH_CACHE_SIZE = _env_int("ATHENA_SEARCH_CACHE_SIZE", 256)
+SEARCH_CACHE_TTL = _env_float("ATHENA_SEARCH_CACHE_TTL", 600.0)
+SEARCH_RESULTS_MAX = _env_int("ATHENA_SEARCH_RESULTS_MAX", 1000)    # (guild, user) selections kept
+SEARCH_RESULTS_TTL = _env_float("ATHENA_SEARCH_RESULTS_TTL", 900.0)
+
+search_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)    # normalized query -> entries
+search_results = TTLCache(SEARCH_RESULTS_MAX, SEARCH_RESULTS_TTL)  # (guild_id, user_id) -> results
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+# --- local audio cache ---
+# Optional: recently/frequently played tracks are kept as Ogg/Opus files so loops,
+# seeks and repeat plays are served from disk. A track is copied in the background
+# by a separate ffmpeg while it plays for the first time.
+AUDIO_CACHE_DIR = os.environ.get("ATHENA_AUDIO_CACHE_DIR", "")      # empty = disabled
+AUDIO_CACHE_BYTES = _env_int("ATHENA_AUDIO_CACHE_BYTES", 2 * 1024**3)
+AUDIO_CACHE_MAX_TRACK = _env_float("ATHENA_AUDIO_CACHE_MAX_TRACK", 1800.0)  # skip longer tracks
+AUDIO_CACHE_DOWNLOADS = _env_int("ATHENA_AUDIO_CACHE_DOWNLOADS", 2)         # concurrent copies
+AUDIO_CACHE_HIT_BONUS = 3600.0  # each play counts as this many seconds of recency (max 10)
+AUDIO_CACHE_RW_TIMEOUT = 30.0   # seconds ffmpeg waits on a silent upstream before failing
+AUDIO_CACHE_SLACK = 120.0       # a copy may take the track's length plus this before it's killed
+
+
+class AudioCache:
+    """video_id -> local .ogg file, kept under a byte budget (per process; shards each enforce their own)."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._index = None    # video_id -> [size, plays, last_access]; built on first use
+        self._active = set()  # video_ids being downloaded
+        self._slots = asyncio.Semaphore(AUDIO_CACHE_DOWNLOADS)
+        self._load_lock = threading.Lock()
+
+    def _path(self, vid: str) -> str:
+        return os.path.join(self.directory, f"{vid}.ogg")
+
+    def _load(self):
+        """The index, scanning the directory the first time. Blocking; run off the loop."""
+        with self._load_lock:
+            if self._index is not None:
+                return self._index
+            index = {}
+            os.makedirs(self.directory, exist_ok=True)
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".part"):
+                    if entry.stat().st_mtime < time.time() - 3600:
+                        os.remove(entry.path)  # interrupted download (recent ones may belong to another shard)
+                elif entry.name.endswith(".ogg"):
+                    st = entry.stat()
+                    index[entry.name[:-4]] = [st.st_size, 0, st.st_mtime]
+            self._index = index
+            return index
+
+    def _find(self, vid: str):
+        index = self._load()
+        path = self._path(vid)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            index.pop(vid, None)
+            return None
+        # other shard processes share the directory, so adopt files they wrote
+        index.setdefault(vid, [size, 0, time.time()])
+        return path
+
+    async def lookup(self, vid: str | None):
+        """Path of the cached file for a video, or None. Doesn't count as a play (see played)."""
+        if not self.directory or not vid:
+            return None
+        path = await asyncio.get_running_loop().run_in_executor(None, self._find, vid)
+        if path is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return path
+
+    def played(self, vid: str | None):
+        """A track actually started; plays and recency decide what stays cached."""
+        item = self._index.get(vid) if self._index and vid else None
+        if item is not None:
+            item[1] += 1
+            item[2] = time.time()
+
+    def fetch_later(self, vid: str | None, info: dict):
+        """Start copying a remote stream into the cache in the background."""
+        if not self.directory or not vid or vid in self._active or info.get("local"):
+            return
+        duration = info.get("duration")
+        if not duration or duration > AUDIO_CACHE_MAX_TRACK or vid in (self._index or ()):
+            return
+        self._active.add(vid)
+        asyncio.get_running_loop().create_task(self._download(vid, info))
+
+    def _store(self, vid: str, part: str, final: str):
+        os.replace(part, final)
+        self._load()[vid] = [os.path.getsize(final), 1, time.time()]
+        self._evict()
+
+    async def _download(self, vid: str, info: dict):
+        loop = asyncio.get_running_loop()
+        final = self._path(vid)
+        part = f"{final}.{os.getpid()}.part"
+        try:
+            if vid in await loop.run_in_executor(None, self._load):
+                return
+            async with self._slots:
+                codec = ["-c:a", "copy"] if info.get("acodec") == "opus" else ["-c:a", "libopus", "-b:a", "128k"]
+                headers = _headers_str(info.get("http_headers"))
+                proc = await asyncio.create_subprocess_exec(
+                    "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+                    *(["-headers", headers] if headers else []),
+                    "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5",
+                    "-rw_timeout", str(int(AUDIO_CACHE_RW_TIMEOUT * 1e6)),
+                    "-i", info["url"], "-vn", "-map", "0:a:0", *codec, "-f", "ogg", part,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+                )
+                limit = info["duration"] + AUDIO_CACHE_SLACK
+                try:
+                    # a stalled upstream mustn't hold a download slot forever
+                    _, err = await asyncio.wait_for(proc.communicate(), limit)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+                    raise RuntimeError(f"download took over {limit:.0f}s, gave up") from None
+            if proc.returncode != 0:
+                raise RuntimeError(err.decode(errors="replace").strip()[-200:] or f"ffmpeg exit {proc.returncode}")
+            await loop.run_in_executor(None, self._store, vid, part, final)
+        except Exception as e:
+            print(f"[audio cache] {vid}: {e}")
+            await loop.run_in_executor(None, _remove_quietly, part)
+        finally:
+            self._active.discard(vid)
+
+    def _evict(self):
+        """Drop the least valuable files (old and rarely played) until under budget. Blocking."""
+        items = list(self._load().items())  # snapshot: lookups may adopt files meanwhile
+        total = sum(item[0] for _, item in items)
+        if total <= self.max_bytes:
+            return
+        items.sort(key=lambda kv: kv[1][2] + min(kv[1][1], 10) * AUDIO_CACHE_HIT_BONUS)
+        for vid, (size, _, _) in items:
+            if total <= self.max_bytes:
+                break
+            total -= size
+            self._index.pop(vid, None)
+            _remove_quietly(self._path(vid))
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_BYTES)
+
+
+async def resolve_playback(url: str, profile: str | None = None):
+    """
+    Like resolve_stream, but prefers a file from the local audio cache
+    (no extraction, no upstream traffic).
+    """
+    if url.startswith(LIBRARY_SCHEME):
+        track = library.get(url)
+        if track is None:
+            raise ExtractionError("that track is no longer in the library")
+        return library.info(track)
+    vid = _video_id(url)
+    path = await audio_cache.lookup(vid)
+    if path is None:
+        return await resolve_stream(url, profile)
+    meta = (await video_meta.fetch([vid])).get(vid)
+    if meta is None:
+        meta = await resolve_stream(url, profile)  # title/duration only; audio still comes from disk
+    return {**meta, "http_headers": None, "url": path, "acodec": "opus", "local": True,
+            "webpage_url": meta.get("webpage_url") or url}
+
+
+
+# --- local library ---
+# Optional: audio files under ATHENA_LIBRARY_DIRS are indexed (tags, duration and
+# codec via ffprobe) into SQLite and kept in memory as token -> tracks and
+# trigram -> tokens maps, so &search/&play can match them by prefix or fuzzily
+# without touching YouTube. Rescans only probe files whose mtime/size changed.
+# Library tracks are referenced as "lib:<id>" and played straight from disk.
+LIBRARY_DIRS = [d for d in os.environ.get("ATHENA_LIBRARY_DIRS", "").split(os.pathsep) if d]
+LIBRARY_DB = os.environ.get("ATHENA_LIBRARY_DB", "athena_library.db")
+LIBRARY_RESCAN = _env_float("ATHENA_LIBRARY_RESCAN", 300.0)  # seconds between incremental rescans
+LIBRARY_EXTS = {".mp3", ".flac", ".ogg", ".opus", ".m4a", ".aac", ".wav", ".webm", ".mka", ".wma", ".alac"}
+LIBRARY_SCHEME = "lib:"
+LIBRARY_MIN_SCORE = 0.5       # weakest match &search lists
+LIBRARY_PLAY_MIN_SCORE = 0.8  # &play <words> only picks a library track this sure
+LIBRARY_PLAY_MIN_COVERAGE = 0.6  # ...and only when the words name most of its title
+LIBRARY_PREFIX_FANOUT = 64    # vocabulary words a prefix may expand to
+LIBRARY_CANDIDATES = 256      # tracks taken per query word (best-matching words first), so a
+                              # common word in a huge library doesn't mean scoring all of it
+LIBRARY_PROBE_WORKERS = 4
+LIBRARY_PROBE_TIMEOUT = 15.0
+
+
+def _library_tokens(text: str) -> list:
+    """Casefolded, accent-free words."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return re.findall(r"\w+", "".join(c for c in text if not unicodedata.combining(c)))
+
+def _trigrams(word: str) -> set:
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _probe_audio(path: str):
+    """{title, artist, album, duration, codec} via ffprobe; None if it isn't playable audio."""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "a:0", "-of", "json",
+           "-show_entries", "format=duration:format_tags=title,artist,album_artist,album"
+                            ":stream=codec_name:stream_tags=title,artist,album_artist,album", path]
+    try:
+        data = json.loads(subprocess.run(cmd, capture_output=True, timeout=LIBRARY_PROBE_TIMEOUT,
+                                         check=True).stdout or b"{}")
+    except (subprocess.CalledProcessError, ValueError):
+        return None  # ffprobe can't read it
+    except (OSError, subprocess.TimeoutExpired):
+        data = None  # no ffprobe / stuck: index by file name, ffmpeg may still play it
+    if data is not None and not data.get("streams"):
+        return None  # no audio stream
+    fmt = (data or {}).get("format") or {}
+    stream = ((data or {}).get("streams") or [{}])[0]
+    tags = {k.lower(): v for k, v in {**(stream.get("tags") or {}), **(fmt.get("tags") or {})}.items()}
+    try:
+        duration = float(fmt["duration"])
+    except (KeyError, TypeError, ValueError):
+        duration = None
+    stem = os.path.splitext(os.path.basename(path))[0].replace("_", " ")
+    return {
+        "title": tags.get("title") or stem,
+        "artist": tags.get("artist") or tags.get("album_artist"),
+        "album": tags.get("album"),
+        "duration": duration,
+        "codec": stream.get("codec_name"),
+    }
+
+
+class LibraryTrack:
+    __slots__ = ("id", "path", "mtime", "size", "title", "artist", "album", "duration", "codec")
+
+    def __init__(self, id, path, mtime, size, title, artist, album, duration, codec):
+        self.id = id
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.title = title
+        self.artist = artist
+        self.album = album
+        self.duration = duration
+        self.codec = codec
+
+    @property
+    def url(self) -> str:
+        return f"{LIBRARY_SCHEME}{self.id}"
+
+    def words(self) -> set:
+        # file and folder names too: untagged collections are usually Artist/Album/Title.ext
+        folder, name = os.path.split(self.path)
+        names = (self.title, self.artist, self.album, os.path.splitext(name)[0], os.path.basename(folder))
+        return set(_library_tokens(" ".join(filter(None, names))))
+
+
+class Library:
+    """The index: rows in SQLite, search maps in memory (loop thread only)."""
+
+    def __init__(self, dirs: list, db_path: str):
+        self.dirs = dirs
+        self.db_path = db_path
+        self.tracks = {}     # id -> LibraryTrack
+        self._by_path = {}   # path -> id
+        self._tokens = {}    # word -> set of track ids
+        self._words = {}     # track id -> its words
+        self._grams = {}     # trigram -> set of words
+        self._vocab = None   # sorted words, rebuilt after changes
+        self._db = None
+        self._loaded = False
+
+    def _conn(self):
+        if self._db is None:
+            self._db = _open_db(self.db_path)
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS library ("
+                    " id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime REAL, size INTEGER,"
+                    " title TEXT, artist TEXT, album TEXT, duration REAL, codec TEXT)"
+                )
+        return self._db
+
+    def _add(self, track: LibraryTrack):
+        self.tracks[track.id] = track
+        self._by_path[track.path] = track.id
+        words = self._words[track.id] = frozenset(track.words())
+        for word in words:
+            ids = self._tokens.get(word)
+            if ids is None:
+                ids = self._tokens[word] = set()
+                for gram in _trigrams(word):
+                    self._grams.setdefault(gram, set()).add(word)
+                self._vocab = None
+            ids.add(track.id)
+
+    def _remove(self, track_id: int):
+        track = self.tracks.pop(track_id, None)
+        if track is None:
+            return
+        self._by_path.pop(track.path, None)
+        for word in self._words.pop(track_id, ()):
+            ids = self._tokens.get(word)
+            if ids is None:
+                continue
+            ids.discard(track_id)
+            if not ids:
+                del self._tokens[word]
+                for gram in _trigrams(word):
+                    words = self._grams.get(gram)
+                    if words is not None:
+                        words.discard(word)
+                        if not words:
+                            del self._grams[gram]
+                self._vocab = None
+
+    def _matches(self, word: str) -> dict:
+        """Vocabulary words matching one query word -> weight (exact > prefix > fuzzy)."""
+        out = {}
+        if word in self._tokens:
+            out[word] = 1.0
+        if len(word) >= 2:
+            if self._vocab is None:
+                self._vocab = sorted(self._tokens)
+            i = bisect_left(self._vocab, word)
+            for token in self._vocab[i:i + LIBRARY_PREFIX_FANOUT]:
+                if not token.startswith(word):
+                    break
+                out.setdefault(token, 0.9)
+        if len(word) >= 3:
+            grams = _trigrams(word)
+            shared = {}
+            for gram in grams:
+                for token in self._grams.get(gram, ()):
+                    shared[token] = shared.get(token, 0) + 1
+            for token, n in shared.items():
+                similarity = 2 * n / (len(grams) + len(token))  # Dice over trigrams (a word has ~len trigrams)
+                if similarity >= 0.5 and similarity > out.get(token, 0.0):
+                    out[token] = min(similarity, 0.85)
+        return out
+
+    def search(self, query: str, limit: int = 5) -> list:
+        """[(score 0..1, LibraryTrack)] best first; every query word counts equally."""
+        words = _library_tokens(query)
+        if not words or not self.tracks:
+            return []
+        matches = [self._matches(word) for word in words]
+        candidates = set()
+        for found in matches:
+            taken = 0
+            for token in sorted(found, key=found.get, reverse=True):
+                ids = self._tokens[token]
+                if taken + len(ids) > LIBRARY_CANDIDATES:
+                    candidates.update(islice(ids, LIBRARY_CANDIDATES - taken))
+                    break
+                candidates.update(ids)
+                taken += len(ids)
+        scored = []
+        for tid in candidates:
+            track_words = self._words[tid]
+            total = 0.0
+            for found in matches:
+                if len(found) < len(track_words):
+                    total += max((w for t, w in found.items() if t in track_words), default=0.0)
+                else:
+                    total += max((found[t] for t in track_words if t in found), default=0.0)
+            scored.append((total / len(words), -len(self.tracks[tid].title or ""), tid))
+        ranked = heapq.nlargest(limit, scored)
+        return [(score, self.tracks[tid]) for score, _, tid in ranked if score >= LIBRARY_MIN_SCORE]
+
+    def get(self, url: str):
+        try:
+            return self.tracks.get(int(url[len(LIBRARY_SCHEME):]))
+        except ValueError:
+            return None
+
+    def resolve(self, text: str):
+        """Track for a lib:<id> reference, or a confident match for plain words, else None."""
+        if text.startswith(LIBRARY_SCHEME):
+            return self.get(text)
+        if not self.tracks or "://" in text or _video_id(text):
+            return None
+        hits = self.search(text, 1)
+        if not hits or hits[0][0] < LIBRARY_PLAY_MIN_SCORE:
+            return None
+        # every query word matching isn't enough ("a", one word of a long title):
+        # the query has to cover the title too, or it goes to YouTube
+        track = hits[0][1]
+        title = set(_library_tokens(track.title or ""))
+        matched = set()
+        for word in _library_tokens(text):
+            matched.update(token for token in self._matches(word) if token in title)
+        return track if title and len(matched) >= LIBRARY_PLAY_MIN_COVERAGE * len(title) else None
+
+    @staticmethod
+    def info(track: LibraryTrack) -> dict:
+        """Playback dict in the shape resolve_playback returns."""
+        return {"url": track.path, "local": True, "http_headers": None, "acodec": track.codec,
+                "title": track.title, "duration": track.duration, "uploader": track.artist,
+                "webpage_url": track.url}
+
+    def _load_rows(self):
+        return self._conn().execute(
+            "SELECT id, path, mtime, size, title, artist, album, duration, codec FROM library"
+        ).fetchall()
+
+    def _scan_blocking(self, known: dict):
+        """Thread: walk the directories, probe new/changed files, update SQLite. Returns (rows, removed paths)."""
+        found, todo = set(), []
+        for root in self.dirs:
+            for dirpath, _dirs, files in os.walk(root):
+                for name in files:
+                    if os.path.splitext(name)[1].lower() not in LIBRARY_EXTS:
+                        continue
+                    path = os.path.abspath(os.path.join(dirpath, name))
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    found.add(path)
+                    if known.get(path) != (st.st_mtime, st.st_size):
+                        todo.append((path, st.st_mtime, st.st_size))
+        removed = [path for path in known if path not in found]
+        with ThreadPoolExecutor(LIBRARY_PROBE_WORKERS, thread_name_prefix="ffprobe") as pool:
+            probed = list(pool.map(_probe_audio, [path for path, _, _ in todo]))
+
+        rows = []
+        db = self._conn()
+        with db:
+            for (path, mtime, size), tags in zip(todo, probed):
+                if tags is None:
+                    if path in known:
+                        removed.append(path)  # was audio, isn't any more
+                    continue
+                db.execute(
+                    "INSERT INTO library (path, mtime, size, title, artist, album, duration, codec)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET"
+                    " mtime = excluded.mtime, size = excluded.size, title = excluded.title,"
+                    " artist = excluded.artist, album = excluded.album,"
+                    " duration = excluded.duration, codec = excluded.codec",
+                    (path, mtime, size, tags["title"], tags["artist"], tags["album"], tags["duration"], tags["codec"]),
+                )
+                track_id = db.execute("SELECT id FROM library WHERE path = ?", (path,)).fetchone()[0]
+                rows.append((track_id, path, mtime, size, tags["title"], tags["artist"],
+                             tags["album"], tags["duration"], tags["codec"]))
+            db.executemany("DELETE FROM library WHERE path = ?", [(path,) for path in removed])
+        return rows, removed
+
+    async def load(self):
+        """Read the saved index (no scanning), once."""
+        if not self._loaded:
+            for row in await asyncio.get_running_loop().run_in_executor(None, self._load_rows):
+                self._add(LibraryTrack(*row))
+            self._loaded = True
+
+    async def refresh(self):
+        """Bring the index up to date with the directories."""
+        loop = asyncio.get_running_loop()
+        await self.load()
+        known = {t.path: (t.mtime, t.size) for t in self.tracks.values()}
+        rows, removed = await loop.run_in_executor(None, self._scan_blocking, known)
+        for path in removed:
+            track_id = self._by_path.get(path)
+            if track_id is not None:
+                self._remove(track_id)
+        for row in rows:
+            self._remove(row[0])
+            self._add(LibraryTrack(*row))
+        if rows or removed:
+            print(f"[library] {len(self.tracks)} tracks ({len(rows)} new/changed, {len(removed)} removed)")
+
+
+library = Library(LIBRARY_DIRS, LIBRARY_DB)
+_library_task = None
+
+
+async def _library_refresher():
+    while True:
+        try:
+            await library.refresh()
+        except Exception as e:
+            print(f"[library] scan failed: {e}")
+        await asyncio.sleep(LIBRARY_RESCAN)
+
+
+# --- durable state ---
+# Optional: queues, volume/loop and the current track + position are snapshotted
+# to SQLite so a restart or crash doesn't wipe every guild's session. Mutations
+# only mark a guild dirty; _state_flusher() writes dirty guilds (and the position
+# of everything playing) in one batch every STATE_FLUSH_INTERVAL seconds. Queues
+# are saved from their journal (the rows that changed), keyed by Track.key, so an
+# edit to a 10k-track queue writes a row or two rather than the whole queue.
+STATE_DB = os.environ.get("ATHENA_STATE_DB", "")                      # empty = disabled
+STATE_FLUSH_INTERVAL = _env_float("ATHENA_STATE_FLUSH_INTERVAL", 2.0)
+RESUME_ON_START = os.environ.get("ATHENA_RESUME_ON_START", "1") == "1"  # rejoin + resume saved tracks
+
+_state_db = None
+_dirty_players = set()  # guild_ids whose player row changed
+_dirty_queues = set()   # guild_ids whose queue changed
+_state_restored = False
+
+
+def _state_changed(player: GuildPlayer, queue: bool = True):
+    """Mark a guild for the next state flush."""
+    if STATE_DB:
+        _dirty_players.add(player.guild_id)
+        if queue:
+            _dirty_queues.add(player.guild_id)
+
+def _state_conn():
+    global _state_db
+    if _state_db is None:
+        _state_db = _open_db(STATE_DB)
+        with _state_db:
+            _state_db.execute(
+                "CREATE TABLE IF NOT EXISTS players ("
+                " guild_id INTEGER PRIMARY KEY, voice_channel_id INTEGER, text_channel_id INTEGER,"
+                " url TEXT, title TEXT, duration REAL, requester_id INTEGER, position REAL,"
+                " volume REAL, looping INTEGER, updated_at REAL)"
+            )
+            _state_db.execute(
+                "CREATE TABLE IF NOT EXISTS queue ("
+                " guild_id INTEGER, pos INTEGER, url TEXT, title TEXT, requester_id INTEGER, duration REAL,"
+                " PRIMARY KEY (guild_id, pos))"
+            )
+    return _state_db
+
+def _is_active(player: GuildPlayer) -> bool:
+    guild = bot.get_guild(player.guild_id)
+    vc = guild.voice_client if guild else None
+    return bool(vc and (vc.is_playing() or vc.is_paused()))
+
+def _queue_row(guild_id: int, track: Track):
+    return (guild_id, track.key, track.url, track.title, track.requester_id, track.duration)
+
+def _snapshot_state():
+    """Copy what needs writing (on the loop thread) so the write can happen elsewhere."""
+    rows, queues_out = [], {}
+    active = {p.guild_id for p in players.values() if _is_active(p)}
+    for guild_id in _dirty_players | _dirty_queues | active:
+        player = players.get(guild_id)
+        if player is None:
+            rows.append((guild_id, None))
+            continue
+        guild = bot.get_guild(guild_id)
+        vc = guild.voice_client if guild else None
+        playing = bool(vc and (vc.is_playing() or vc.is_paused()))
+        rows.append((guild_id, (
+            guild_id,
+            vc.channel.id if vc and vc.channel else None,
+            player.text_channel_id,
+            player.webpage_url if playing else None,
+            player.title if playing else None,
+            player.duration if playing else None,
+            player.requester_id if playing else None,
+            player.position() if playing else None,
+            player.volume,
+            int(player.looping),
+            time.time(),
+        )))
+        if guild_id in _dirty_queues:
+            rewrite, ops = player.queue.take_journal()
+            if rewrite:
+                queues_out[guild_id] = (True, [_queue_row(guild_id, t) for t in player.queue])
+            elif ops:
+                queues_out[guild_id] = (False, [
+                    (op, _queue_row(guild_id, arg) if op == "put" else (guild_id, arg)) for op, arg in ops
+                ])
+    _dirty_players.clear()
+    _dirty_queues.clear()
+    return rows, queues_out
+
+def _write_state(rows, queues_out):
+    db = _state_conn()
+    with db:
+        for guild_id, row in rows:
+            if row is None:
+                db.execute("DELETE FROM players WHERE guild_id = ?", (guild_id,))
+                db.execute("DELETE FROM queue WHERE guild_id = ?", (guild_id,))
+            else:
+                db.execute("INSERT OR REPLACE INTO players VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+        for guild_id, (rewrite, items) in queues_out.items():
+            if rewrite:
+                db.execute("DELETE FROM queue WHERE guild_id = ?", (guild_id,))
+                db.executemany("INSERT INTO queue VALUES (?, ?, ?, ?, ?, ?)", items)
+                continue
+            for op, row in items:  # in order: a key can be deleted and then reused
+                if op == "put":
+                    db.execute("INSERT OR REPLACE INTO queue VALUES (?, ?, ?, ?, ?, ?)", row)
+                else:
+                    db.execute("DELETE FROM queue WHERE guild_id = ? AND pos = ?", row)
+
+async def flush_state():
+    if not STATE_DB:
+        return
+    rows, queues_out = _snapshot_state()
+    if rows or queues_out:
+        await asyncio.get_running_loop().run_in_executor(None, _write_state, rows, queues_out)
+
+async def _state_flusher():
+    while True:
+        await asyncio.sleep(STATE_FLUSH_INTERVAL)
+        try:
+            await flush_state()
+        except Exception as e:
+            print(f"[state] flush failed: {e}")
+
+def _read_state(guild_ids):
+    db = _state_conn()
+    saved, queued = [], []
+    for i in range(0, len(guild_ids), 500):  # stay under SQLite's bound-variable limit
+        chunk = guild_ids[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        saved += db.execute(f"SELECT * FROM players WHERE guild_id IN ({marks})", chunk).fetchall()
+        queued += db.execute(
+            f"SELECT guild_id, pos, url, title, requester_id, duration FROM queue"
+            f" WHERE guild_id IN ({marks}) ORDER BY guild_id, pos", chunk
+        ).fetchall()
+    return saved, queued
+
+
+class _ResumeContext:
+    """Just enough of commands.Context to drive playback without a command message."""
+
+    def __init__(self, bot, guild, channel, author):
+        self.bot = bot
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, *args, **kwargs):
+        if self.channel is not None:
+            return await self.channel.send(*args, **kwargs)
+
+    async def invoke(self, command, /, *args, **kwargs):
+        return await command.callback(self, *args, **kwargs)
+
+    def typing(self):
+        return self.channel.typing()
+
+
+async def restore_state():
+    """Rebuild queues for this process's guilds and optionally resume what was playing."""
+    guild_ids = [g.id for g in bot.guilds]
+    if not STATE_DB or not guild_ids:
+        return
+    saved, queued = await asyncio.get_running_loop().run_in_executor(None, _read_state, guild_ids)
+
+    tracks = {}
+    for guild_id, pos, url, title, requester_id, duration in queued:
+        tracks.setdefault(guild_id, []).append((Track(url, title, requester_id, duration), pos))
+    for guild_id, rows in tracks.items():
+        player = get_player(guild_id)
+        queued_since = list(player.queue)  # queued while we were reading; the saved queue goes first
+        player.queue = TrackQueue([t for t, _ in rows] + queued_since, journal=True)
+        if queued_since:
+            _state_changed(player)  # renumbered, so the journal says rewrite it
+            continue
+        player.queue.take_journal()  # matches the DB already; keep its keys
+        for track, pos in rows:
+            track.key = pos
+
+    for (guild_id, voice_id, text_id, url, title, duration, requester_id,
+         position, vol_, looping_, _updated) in saved:
+        player = get_player(guild_id)
+        player.volume = vol_ if vol_ is not None else 1.0
+        player.looping = bool(looping_)
+        player.text_channel_id = text_id
+        if RESUME_ON_START and url and voice_id:
+            try:
+                await _resume_guild(guild_id, voice_id, text_id, url, requester_id, position)
+            except Exception as e:
+                print(f"[state] couldn't resume guild {guild_id}: {e}")
+
+async def _resume_guild(guild_id, voice_id, text_id, url, requester_id, position):
+    guild = bot.get_guild(guild_id)
+    channel = guild.get_channel(voice_id) if guild else None
+    if channel is None:
+        return
+    author = (guild.get_member(requester_id) if requester_id else None) or guild.me
+    ctx = _ResumeContext(bot, guild, guild.get_channel(text_id) if text_id else None, author)
+    async with get_player(guild_id).lock:
+        if not guild.voice_client:
+            await channel.connect(timeout=10.0)
+    info = await resolve_playback(url)
+    _start_track(ctx, info, url, requester_id, offset=position)
+    announce_now_playing(ctx.channel, f"Resumed **{get_player(guild_id).title}** at {_fmt_time(position)} after a restart.")
+
+
+# --- sharding ---
+# ATHENA_SHARD_COUNT switches to AutoShardedBot: "auto" lets Discord pick the shard
+# count for a single process; a number N with ATHENA_SHARD_IDS (e.g. "0,1,2") makes
+# this process own just those shards. `python Athena.py --shards N --procs P` runs P
+# such processes. All guild state (players, caches in memory, voice, broadcast
+# stations) is per process, and so is the audio cache's disk budget. Crashed
+# workers are restarted with exponential backoff, up to SHARD_MAX_RESTARTS in a row.
+SHARD_COUNT = os.environ.get("ATHENA_SHARD_COUNT", "")   # "", "auto" or an int
+SHARD_IDS = [int(x) for x in os.environ.get("ATHENA_SHARD_IDS", "").split(",") if x.strip()]
+SHARD_LAUNCH_STAGGER = _env_float("ATHENA_SHARD_LAUNCH_STAGGER", 5.0)  # seconds between worker starts
+SHARD_RESTART_DELAY = 5.0       # first restart delay; doubles per consecutive crash
+SHARD_RESTART_MAX_DELAY = 300.0
+SHARD_MAX_RESTARTS = _env_int("ATHENA_SHARD_MAX_RESTARTS", 10)  # consecutive crashes before giving up on a worker
+SHARD_HEALTHY_AFTER = 600.0     # a worker up this long has its crash count reset
+
+_bot_kwargs = {}
+if SHARD_COUNT.isdigit():
+    _bot_kwargs = {"shard_count": int(SHARD_COUNT), "shard_ids": SHARD_IDS or None}
+
+
+def _shard_chunks(total: int, procs: int):
+    """Split shard ids 0..total-1 into `procs` contiguous ranges."""
+    procs = _clamp(procs, 1, total)
+    size, extra = divmod(total, procs)
+    chunks, start = [], 0
+    for i in range(procs):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(list(range(start, end)))
+        start = end
+    return chunks
+
+def launch_shards(total: int, procs: int):
+    """Run and supervise worker processes that each own a range of `total` shards."""
+    chunks = _shard_chunks(total, procs)
+    children = {}  # index -> Popen
+    started = {}   # index -> time.monotonic() of the last spawn
+    crashes = {}   # index -> consecutive crashes
+    restart_at = {}  # index -> time.monotonic() a crashed worker comes back
+    failed = False
+    stopping = False
+
+    def spawn(i):
+        env = {**os.environ, "ATHENA_SHARD_COUNT": str(total),
+               "ATHENA_SHARD_IDS": ",".join(map(str, chunks[i]))}
+        # one metrics port / dump file per worker
+        if METRICS_PORT:
+            env["ATHENA_METRICS_PORT"] = str(METRICS_PORT + i)
+        if METRICS_JSON:
+            root, ext = os.path.splitext(METRICS_JSON)
+            env["ATHENA_METRICS_JSON"] = f"{root}.{i}{ext}"
+        print(f"[launcher] starting shards {chunks[i][0]}-{chunks[i][-1]} of {total}")
+        children[i] = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+        started[i] = time.monotonic()
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for child in children.values():
+            if child.poll() is None:
+                child.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for i in range(len(chunks)):
+        if stopping:
+            break
+        spawn(i)
+        time.sleep(SHARD_LAUNCH_STAGGER)  # stay under Discord's identify rate limit
+
+    while not stopping:
+        time.sleep(1.0)
+        now = time.monotonic()
+        for i, child in list(children.items()):
+            code = child.poll()
+            if code is None or stopping:
+                continue
+            del children[i]
+            if code == 0:
+                continue  # clean exit; don't bring it back
+            crashes[i] = 1 if now - started[i] >= SHARD_HEALTHY_AFTER else crashes.get(i, 0) + 1
+            name = f"shards {chunks[i][0]}-{chunks[i][-1]}"
+            if crashes[i] > SHARD_MAX_RESTARTS:
+                print(f"[launcher] {name} exited with {code}, {crashes[i]} crashes in a row; giving up on them")
+                failed = True
+                continue
+            delay = min(SHARD_RESTART_DELAY * 2 ** (crashes[i] - 1), SHARD_RESTART_MAX_DELAY)
+            print(f"[launcher] {name} exited with {code}; restarting in {delay:g}s")
+            restart_at[i] = now + delay
+        for i, when in list(restart_at.items()):
+            if when <= now and not stopping:
+                del restart_at[i]
+                spawn(i)
+        if not children and not restart_at:
+            break
+    for child in children.values():
+        child.wait()
+    return 1 if failed else 0
 
 
 # Initialize bot
-bot = commands.Bot(command_prefix="&", intents=intents)
+class AthenaBot(commands.AutoShardedBot if SHARD_COUNT else commands.Bot):
+    async def close(self):
+        # snapshot before voice clients are torn down, so the current track survives
+        try:
+            await flush_state()
+        except Exception as e:
+            print(f"[state] final flush failed: {e}")
+        await super().close()
+
+
+bot = AthenaBot(command_prefix="&", intents=intents, **_bot_kwargs)
+_state_flusher_task = None
 
 @bot.event
 async def on_ready():
+    global _cache_flusher_task, _state_flusher_task, _state_restored, _reaper_task, _library_task
+    if _cache_flusher_task is None:
+        _cache_flusher_task = asyncio.get_running_loop().create_task(_cache_flusher())
+    if _reaper_task is None:
+        _reaper_task = asyncio.get_running_loop().create_task(_reaper())
+    await start_metrics()
+    if LIBRARY_DIRS and _library_task is None:
+        try:
+            await library.load()  # before restore_state, which may resume lib: tracks
+        except Exception as e:
+            print(f"[library] load failed: {e}")
+        _library_task = asyncio.get_running_loop().create_task(_library_refresher())
+    if STATE_DB and not _state_restored:
+        _state_restored = True
+        # flush from the start, so edits made while a big state is restoring are saved too
+        _state_flusher_task = asyncio.get_running_loop().create_task(_state_flusher())
+        try:
+            await restore_state()
+        except Exception as e:
+            print(f"[state] restore failed: {e}")
     print("Salutations.")
 
-join_locks = {}  # one lock per guild to avoid concurrent connects
-
-def get_guild_lock(guild_id: int) -> asyncio.Lock:
-    lock = join_locks.get(guild_id)
-    if lock is None:
-        lock = asyncio.Lock()
-        join_locks[guild_id] = lock
-    return lock
-
 def _fmt_time(sec):
     if sec is None: return "Unknown"
     sec = int(max(0, sec))
@@ -60,6 +1727,26 @@ def _headers_str(h: dict | None) -> str:
     if not h: return ""
     return "\r\n".join(f"{k}: {v}" for k, v in h.items())
 
+def _ffmpeg_before(headers: dict | None, offset: float | None = None, local: bool = False) -> str:
+    """FFmpeg input options: optional start offset, request headers and reconnect."""
+    seek = f"-ss {offset:g} " if offset else ""
+    if local:
+        return seek.strip()
+    headers_blob = _headers_str(headers)
+    return (
+        seek
+        + (f'-headers "{headers_blob}" ' if headers_blob else "")
+        + "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 "
+        + '-user_agent "Mozilla/5.0"'
+    )
+
+def _progress_bar(pos: float, total: float | None, width: int = 18) -> str:
+    """`▬▬▬🔘▬▬▬ 01:23 / 04:56` (just the elapsed time for live/unknown lengths)."""
+    if not total:
+        return _fmt_time(pos)
+    filled = int(width * _clamp(pos / total, 0.0, 1.0))
+    return f"{'▬' * filled}🔘{'▬' * (width - filled)} {_fmt_time(pos)} / {_fmt_time(total)}"
+
 def _clamp(x, lo, hi):
     return max(lo,min(hi,x))
 
@@ -84,50 +1771,1153 @@ def _parse_timestamp(s: str):
 def is_playlist_link(url: str) -> bool:
     return "list=" in url or "/playlist?" in url
 
-def extract_playlist(url: str, max_items: int = 50):
+# --- playlist streaming ---
+# Playlists are read with process=False, which leaves `entries` as yt-dlp's lazy
+# page iterator; each entry is handed to the loop as soon as its page arrives.
+# This is mostly paging through JSON, so it always runs on threads, even with
+# the process extraction backend (generators can't cross process boundaries).
+# Each page read still takes an extraction slot and gets EXTRACT_TIMEOUT, so a
+# big playlist can't crowd out play/search or hang on one stuck page.
+PLAYLIST_MAX = _env_int("ATHENA_PLAYLIST_MAX", 1000)
+PLAYLIST_WORKERS = _env_int("ATHENA_PLAYLIST_WORKERS", 2)
+PLAYLIST_PROGRESS_INTERVAL = 2.0  # seconds between progress message edits
+PLAYLIST_PAGE = 100               # entries read per slot (a YouTube page)
+
+_playlist_executor = None
+_PLAYLIST_DONE = object()
+
+
+def _playlist_entry(e: dict):
+    """(webpage_url, title, duration|None) for a flat playlist entry, or None."""
+    vid_id = e.get("id")
+    title = e.get("title", "Unknown")
+    duration = e.get("duration")  # often None in flat
+    page_url = e.get("url") or (f"https://www.youtube.com/watch?v={vid_id}" if vid_id else None)
+    if not page_url:
+        return None
+    # Sometimes flat URLs are just video IDs; ensure full URL
+    if not page_url.startswith("http"):
+        page_url = f"https://www.youtube.com/watch?v={page_url}"
+    return (page_url, title, duration)
+
+def _open_playlist_blocking(url: str):
+    """The playlist's lazy entry iterator; fetches its first page."""
+    ydl = _get_ydl("playlist")
+    info = ydl.extract_info(url, download=False, process=False)
+    # watch?v=...&list=... resolves to a pointer at the playlist itself first
+    for _ in range(3):
+        if not info or info.get("_type") not in ("url", "url_transparent"):
+            break
+        info = ydl.extract_info(info["url"], download=False, process=False, ie_key=info.get("ie_key"))
+    return iter((info or {}).get("entries") or ())
+
+def _read_playlist_blocking(entries, limit: int, push, stop: threading.Event) -> int:
+    """Push up to `limit` entries; returns how many (fewer means the playlist ran out or was stopped)."""
+    count = 0
+    for e in entries:
+        if stop.is_set():
+            break
+        entry = _playlist_entry(e) if e else None
+        if entry:
+            push(entry)
+            count += 1
+            if count >= limit:
+                break
+    return count
+
+class _PlaylistFlight:
+    """One playlist read, shared by every guild loading the same URL at the same time."""
+
+    __slots__ = ("max_items", "entries", "done", "error", "changed", "stop", "readers", "task")
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self.entries = []
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Event()  # replaced after every push
+        self.stop = threading.Event()
+        self.readers = 0
+        self.task = None
+
+    def push(self, item):
+        if self.done:
+            return  # a page abandoned after a timeout may still trickle in
+        if item is _PLAYLIST_DONE:
+            self.done = True
+        elif isinstance(item, Exception):
+            self.error = item
+            self.done = True
+        else:
+            self.entries.append(item)
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+_playlist_flights = {}  # url -> _PlaylistFlight
+
+
+async def _playlist_step(fn, *args):
+    """Run one blocking playlist read on the playlist pool while holding an extraction slot."""
+    await _extract_slots.acquire()
+    try:
+        fut = asyncio.get_running_loop().run_in_executor(_playlist_executor, fn, *args)
+    except BaseException:
+        _extract_slots.release()
+        raise
+    # as with extractions, the slot is held until the read really ends
+    fut.add_done_callback(lambda f: _release_slot(_extract_slots, f))
+    return await asyncio.shield(fut)
+
+async def _read_playlist(url: str, flight: _PlaylistFlight, timeout: float | None):
+    loop = asyncio.get_running_loop()
+
+    def push(item):
+        loop.call_soon_threadsafe(flight.push, item)
+
+    try:
+        entries = await asyncio.wait_for(_playlist_step(_open_playlist_blocking, url), timeout)
+        total = 0
+        while total < flight.max_items and not flight.stop.is_set():
+            want = min(PLAYLIST_PAGE, flight.max_items - total)
+            got = await asyncio.wait_for(
+                _playlist_step(_read_playlist_blocking, entries, want, push, flight.stop), timeout)
+            total += got
+            if got < want:
+                break
+    except asyncio.TimeoutError:
+        flight.stop.set()  # the abandoned read stops at its next entry
+        flight.push(ExtractionTimeout(f"playlist page timed out after {timeout:g}s"))
+    except Exception as e:
+        flight.push(ExtractionError(str(e)))
+    finally:
+        flight.push(_PLAYLIST_DONE)
+        if _playlist_flights.get(url) is flight:
+            del _playlist_flights[url]
+
+def _start_playlist_flight(url: str, max_items: int, timeout: float | None) -> _PlaylistFlight:
+    global _playlist_executor
+    if _playlist_executor is None:
+        _playlist_executor = ThreadPoolExecutor(max_workers=PLAYLIST_WORKERS, thread_name_prefix="ytdlp-playlist")
+    flight = _playlist_flights[url] = _PlaylistFlight(max_items)
+    flight.task = asyncio.get_running_loop().create_task(_read_playlist(url, flight, timeout))
+    return flight
+
+async def iter_playlist(url: str, max_items: int = 50, *, timeout: float | None = EXTRACT_TIMEOUT):
     """
-    Returns a list of (webpage_url, title, duration|None) for a YouTube playlist/mix.
-    Uses flat extraction for speed; duration may be None.
+    Async iterator of (webpage_url, title, duration|None) for a YouTube playlist/mix,
+    yielding entries page by page instead of waiting for the whole list.
+    Concurrent loads of the same playlist share one read.
+    `timeout` bounds each page read (slot wait included), not the whole playlist.
     """
-    opts = {
-        **YDL_SEARCH_OPTS,
-        "noplaylist": False,                  # allow playlist extraction here
-        "extract_flat": "in_playlist",       # no stream links; fast
-        "quiet": True,
-    }
-    with youtube_dl.YoutubeDL(opts) as ydl:
-        info = ydl.extract_info(url, download=False)
-
-    # Normalize to a list of entries
-    entries = info.get("entries") or []
-    out = []
-    for e in entries[:max_items]:
-        vid_id = e.get("id")
-        title = e.get("title", "Unknown")
-        duration = e.get("duration")  # often None in flat
-        page_url = e.get("url") or (f"https://www.youtube.com/watch?v={vid_id}" if vid_id else None)
-        if page_url:
-            # Sometimes flat URLs are just video IDs; ensure full URL
-            if not page_url.startswith("http"):
-                page_url = f"https://www.youtube.com/watch?v={page_url}"
-            out.append((page_url, title, duration))
-    return out
-    
+    flight = _playlist_flights.get(url)
+    if flight is None or flight.max_items < max_items:
+        flight = _start_playlist_flight(url, max_items, timeout)
+    flight.readers += 1
+    i = 0
+    try:
+        while i < max_items:
+            if i < len(flight.entries):
+                yield flight.entries[i]
+                i += 1
+                continue
+            if flight.done:
+                if flight.error:
+                    raise flight.error
+                return
+            await flight.changed.wait()
+    finally:
+        flight.readers -= 1
+        if flight.readers == 0:
+            # last reader gone: let the read stop paging early
+            flight.stop.set()
+            if _playlist_flights.get(url) is flight:
+                del _playlist_flights[url]
+
+
+# --- prefetch ---
+# While a track plays, resolve the stream URL of the next queued track(s) into the
+# stream cache so the transition only costs ffmpeg startup.
+PREFETCH_DEPTH = _env_int("ATHENA_PREFETCH_DEPTH", 1)
+
+
+async def _prefetch(urls):
+    _call_site.set("prefetch")
+    for url in urls:
+        try:
+            await resolve_playback(url)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[prefetch] {url}: {e}")
+
+def schedule_prefetch(player: GuildPlayer):
+    """(Re)start prefetching after the head of a guild's queue may have changed."""
+    urls = tuple(track.url for track in player.queue.slice(0, PREFETCH_DEPTH))
+    if player.prefetch:
+        task, pending = player.prefetch
+        if pending == urls and not task.done():
+            return  # already warming exactly these
+        task.cancel()
+        player.prefetch = None
+    if urls:
+        player.prefetch = (asyncio.get_running_loop().create_task(_prefetch(urls)), urls)
+
+
+# --- metadata hydration ---
+# Flat playlist entries usually lack a duration. A few low-priority background
+# workers fill in duration/title/thumbnail for queued entries, one video at a time,
+# remembering the results in video_meta so no video is looked up twice.
+_hydrate_pending = deque()   # (guild_id, Track)
+_hydrate_queued = set()      # Tracks currently in _hydrate_pending
+_hydrate_workers = set()
+HYDRATE_BATCH = 200          # pending entries looked up in the metadata DB per query
+
+
+def _apply_meta(player: GuildPlayer, track: Track, meta: dict):
+    track.title = meta.get("title") or track.title
+    if meta.get("duration") is not None:
+        player.queue.set_duration(track, meta["duration"])
+        _state_changed(player)
+
+def hydrate_later(player: GuildPlayer, track: Track):
+    """
+    Queue a background metadata lookup for a queued track (no-op if already known).
+    Memory is checked here; the worker checks SQLite in batches before extracting.
+    """
+    meta = video_meta.get(_video_id(track.url))
+    if meta is not None:
+        _apply_meta(player, track, meta)
+        return
+    if track in _hydrate_queued:
+        return
+    _hydrate_queued.add(track)
+    _hydrate_pending.append((player.guild_id, track))
+    # one worker even with hydration off: the metadata DB costs no extraction
+    while len(_hydrate_workers) < max(1, HYDRATE_CONCURRENCY):
+        task = asyncio.get_running_loop().create_task(_hydrate_worker())
+        _hydrate_workers.add(task)
+        task.add_done_callback(_hydrate_workers.discard)
+
+def drop_hydration(guild_id: int):
+    """Forget a guild's pending lookups, e.g. when its player is evicted."""
+    kept = deque()
+    for entry in _hydrate_pending:
+        if entry[0] == guild_id:
+            _hydrate_queued.discard(entry[1])
+        else:
+            kept.append(entry)
+    _hydrate_pending.clear()
+    _hydrate_pending.extend(kept)
+
+async def _hydrate_worker():
+    _call_site.set("hydrate")
+    checked = set()  # video ids this worker already looked up in SQLite, ahead of their turn
+    while _hydrate_pending:
+        guild_id, track = _hydrate_pending.popleft()
+        _hydrate_queued.discard(track)
+        vid = _video_id(track.url)
+        player = players.get(guild_id)
+        if player is None or not track.queued:
+            checked.discard(vid)
+            continue  # already played, removed or cleared
+        meta = video_meta.get(vid)
+        if meta is None and vid not in checked:
+            # one SQLite query for this entry and the ones waiting behind it
+            vids = [vid] + [_video_id(t.url) for _, t in islice(_hydrate_pending, HYDRATE_BATCH - 1)]
+            checked.update(vids)
+            meta = (await video_meta.fetch(vids)).get(vid)
+        checked.discard(vid)
+        if meta is None and HYDRATE_CONCURRENCY > 0:
+            try:
+                info = await extract_info(track.url, STREAM_PROFILE, background=True)
+                meta = _remember_meta(info, track.url) or info
+            except Exception as e:
+                print(f"[hydrate] {track.url}: {e}")
+                continue
+        if meta:
+            _apply_meta(player, track, meta)
 
 
 async def play_next_in_queue(ctx):
     """Helper function to play next track on server's queue."""
 
-    guild_id = ctx.guild.id
+    player = get_player(ctx.guild.id)
     vc = ctx.voice_client
 
     if not vc or not vc.is_connected():
         return
-    if not queues[guild_id]:
-        await ctx.send("Queue is now empty.")
+    if not player.queue:
+        player.ended_at = None  # nothing follows, so there's no gap to measure
+        notify(ctx.channel, "Queue is now empty.")
+        return
+    track = player.queue.popleft()
+    _state_changed(player)
+    await ctx.invoke(play, url=track.url)
+
+# --- channel notices ---
+# Playback chatter ("Now playing", "Added X to the queue", ...) doesn't go out as
+# one message per event. Each text channel gets an outbox that collects notices
+# for NOTICE_DEBOUNCE seconds and sends them as a single message, and "Now
+# playing" lives in one message per channel that's edited in place for as long
+# as it's still the newest message there. A busy server then costs a fixed
+# handful of API calls per track instead of one per event, and commands never
+# wait on Discord's rate limits to post them.
+NOTICE_LEVELS = {"quiet": 0, "normal": 1, "verbose": 2}
+NOTICE_VERBOSITY = NOTICE_LEVELS.get(os.environ.get("ATHENA_NOTICE_VERBOSITY", "normal").lower(), 1)
+NOTICE_DEBOUNCE = _env_float("ATHENA_NOTICE_DEBOUNCE", 1.5)
+NOTICE_MAX_LINES = 10      # lines per batched message; the rest become "...and N more"
+NOW_PLAYING_REUSE = 1800.0  # seconds a now-playing message may keep being edited
+
+
+class _Outbox:
+    __slots__ = ("channel", "lines", "dropped", "now_playing", "np_message", "np_sent_at", "task", "active_at")
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.lines = []
+        self.dropped = 0
+        self.now_playing = None
+        self.np_message = None
+        self.np_sent_at = 0.0
+        self.task = None
+        self.active_at = time.monotonic()
+
+
+_outboxes = {}  # text channel id -> _Outbox
+
+
+def _outbox(channel) -> _Outbox:
+    box = _outboxes.get(channel.id)
+    if box is None:
+        box = _outboxes[channel.id] = _Outbox(channel)
+    box.channel = channel
+    box.active_at = time.monotonic()
+    return box
+
+def _schedule_flush(box: _Outbox):
+    if box.task is None or box.task.done():
+        box.task = asyncio.get_running_loop().create_task(_flush_outbox(box))
+
+def notify(channel, text: str, level: int = 1):
+    """Queue a notice for `channel`; dropped when it's above the configured verbosity."""
+    if channel is None or level > NOTICE_VERBOSITY:
         return
-    next_url, next_title, requester_id, duration = queues[guild_id].popleft()
-    await ctx.invoke(play, url=next_url)
+    box = _outbox(channel)
+    if len(box.lines) < NOTICE_MAX_LINES:
+        box.lines.append(text)
+    else:
+        box.dropped += 1
+    metrics.inc("notices_total")
+    _schedule_flush(box)
+
+def announce_now_playing(channel, text: str):
+    """Show `text` in the channel's now-playing message; only the latest one per window goes out."""
+    if channel is None or NOTICE_VERBOSITY < 1:
+        return
+    box = _outbox(channel)
+    box.now_playing = text
+    metrics.inc("notices_total")
+    _schedule_flush(box)
+
+def _np_editable(box: _Outbox) -> bool:
+    # verbose servers get a fresh message per track; otherwise edit while nothing's been posted below it
+    if NOTICE_VERBOSITY >= 2 or box.np_message is None:
+        return False
+    if time.monotonic() - box.np_sent_at > NOW_PLAYING_REUSE:
+        return False
+    return getattr(box.channel, "last_message_id", None) == box.np_message.id
+
+async def _post_now_playing(box: _Outbox, text: str):
+    if _np_editable(box):
+        try:
+            await box.np_message.edit(content=text)
+            metrics.inc("notice_messages_total", kind="edited")
+            return
+        except discord.NotFound:
+            box.np_message = None  # deleted under us; post a fresh one instead
+    box.np_message = await box.channel.send(text)
+    box.np_sent_at = time.monotonic()
+    metrics.inc("notice_messages_total", kind="sent")
+
+async def _flush_outbox(box: _Outbox):
+    await asyncio.sleep(NOTICE_DEBOUNCE)
+    while box.lines or box.now_playing:
+        try:
+            if box.lines:
+                count, dropped = len(box.lines), box.dropped
+                lines = box.lines[:count] + ([f"...and {dropped} more."] if dropped else [])
+                await box.channel.send("\n".join(lines)[:2000])
+                # only forgotten once they're out; more may have arrived meanwhile
+                del box.lines[:count]
+                box.dropped -= dropped
+                metrics.inc("notice_messages_total", kind="sent")
+            now_playing = box.now_playing
+            if now_playing:
+                await _post_now_playing(box, now_playing)
+                if box.now_playing is now_playing:
+                    box.now_playing = None
+        except discord.HTTPException as e:
+            # whatever wasn't sent stays in the box for the next flush
+            print(f"[notices] couldn't post to channel {box.channel.id}: {e}")
+            return
+
+def _prune_outboxes(now: float) -> int:
+    """Forget outboxes with nothing pending that haven't been used for a while; returns how many."""
+    pruned = 0
+    for channel_id, box in list(_outboxes.items()):
+        if (box.task is None or box.task.done()) and now - box.active_at > NOW_PLAYING_REUSE:
+            del _outboxes[channel_id]
+            pruned += 1
+    return pruned
+
+# --- playback ---
+FRAME_SECONDS = 0.02  # discord.py reads one 20 ms frame per read(), PCM or Opus
+
+
+class TrackedSource(discord.AudioSource):
+    """
+    Wraps an ffmpeg source and counts the frames handed to the voice client, so the
+    position only advances for audio that was actually sent (pauses stop read()).
+    """
+
+    def __init__(self, original: discord.AudioSource, offset: float = 0.0):
+        self.original = original
+        self.offset = offset  # where in the track this ffmpeg process started (-ss)
+        self.frames = 0
+        self.last_read = time.monotonic()  # when the last frame came out of ffmpeg
+        self.eof = False                   # ffmpeg's output ran dry
+        self.stream_error = None           # fatal-looking line from ffmpeg's stderr
+        self.on_first_frame = None         # called from the audio thread when audio starts
+
+    @property
+    def position(self) -> float:
+        return self.offset + self.frames * FRAME_SECONDS
+
+    def read(self) -> bytes:
+        data = self.original.read()
+        if data:
+            self.frames += 1
+            self.last_read = time.monotonic()
+            if self.frames == 1 and self.on_first_frame:
+                self.on_first_frame()
+        else:
+            self.eof = True
+        return data
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def cleanup(self):
+        self.original.cleanup()
+
+
+_ffmpeg_sources = set()  # every TrackedSource whose ffmpeg may still be running (see the reaper)
+
+# ffmpeg lines meaning the URL is dead (expired/forbidden); -reconnect can't fix those
+_STREAM_ERROR_RE = re.compile(r"(HTTP error|Server returned) 4\d\d")
+
+
+def _scan_stderr(stream, tracked: TrackedSource):
+    """Thread: read ffmpeg's stderr until it exits, flagging dead-URL errors."""
+    with stream:
+        for raw in stream:
+            line = raw.decode("utf-8", "replace").strip()
+            if _STREAM_ERROR_RE.search(line):
+                tracked.stream_error = line
+                print(f"[ffmpeg] {line}")
+
+def _make_source(info: dict, volume: float, offset: float | None = None, mode: str | None = None):
+    """(audio source to play, TrackedSource inside it) for a resolved stream at the given volume."""
+    mode = mode or PLAYBACK_MODE
+    local = info.get("local", False)
+    before = _ffmpeg_before(info.get("http_headers"), offset, local)
+    opts = "-vn -err_detect ignore_err"
+    err_r = err_w = None
+    kwargs = {}
+    if not local:
+        # watch stderr for HTTP errors; -loglevel keeps the pipe to what matters
+        before = f"-hide_banner -loglevel warning {before}"
+        r, w = os.pipe()
+        err_r, err_w = os.fdopen(r, "rb"), os.fdopen(w, "wb")
+        kwargs["stderr"] = err_w
+    spawn_started = time.monotonic()
+    try:
+        if mode == "opus":
+            if volume == 1.0:
+                # copy Opus packets straight through when the source already is Opus
+                codec = "opus" if info.get("acodec") == "opus" else None
+                base = discord.FFmpegOpusAudio(info["url"], before_options=before, options=opts, codec=codec, **kwargs)
+            else:
+                base = discord.FFmpegOpusAudio(info["url"], before_options=before, options=f"{opts} -af volume={volume:g}", **kwargs)
+        else:
+            base = discord.FFmpegPCMAudio(info["url"], before_options=before, options=opts, **kwargs)
+    except Exception:
+        if err_r:
+            err_r.close()
+        raise
+    finally:
+        if err_w:
+            err_w.close()  # ffmpeg holds the write end now; we'd never see EOF otherwise
+    metrics.observe("ffmpeg_spawn_seconds", time.monotonic() - spawn_started, mode=mode)
+    tracked = TrackedSource(base, float(offset or 0))
+    _ffmpeg_sources.add(tracked)
+    if err_r:
+        threading.Thread(target=_scan_stderr, args=(err_r, tracked), daemon=True).start()
+    if mode == "opus":
+        return tracked, tracked
+    return discord.PCMVolumeTransformer(tracked, volume=volume), tracked
+
+def _play_info(ctx, info: dict, offset: float | None = None, requested_at: float | None = None):
+    """
+    (Re)start ffmpeg for `info` at `offset`, replacing whatever is playing.
+    `requested_at` (time.monotonic()) is when the user asked, for time-to-first-audio.
+    """
+    player = get_player(ctx.guild.id)
+    vc = ctx.voice_client
+    player.generation += 1
+    gen = player.generation
+    loop = ctx.bot.loop
+    site = _call_site.get()
+
+    def _after(error: Exception | None):
+        if gen != player.generation:
+            return  # stopped on purpose for a seek/volume/loop restart
+        if error:
+            print(f"FFmpeg after() error: {error}")
+            if not info.get("local"):
+                asyncio.run_coroutine_threadsafe(_refresh_stream(ctx, gen, f"playback error: {error}"), loop)
+        elif tracked.eof and _ended_early(player, tracked, info):
+            # expired/throttled URL: ffmpeg gave up before the end of the track
+            asyncio.run_coroutine_threadsafe(
+                _refresh_stream(ctx, gen, f"stream ended at {_fmt_time(tracked.position)}"), loop)
+        elif player.looping and player.webpage_url:
+            player.ended_at = time.monotonic()
+            asyncio.run_coroutine_threadsafe(_loop_restart(ctx), loop)
+        else:
+            # when finished, advance the queue
+            player.ended_at = time.monotonic()
+            asyncio.run_coroutine_threadsafe(play_next_in_queue(ctx), loop)
+
+    source, tracked = _make_source(info, player.volume, offset)
+    tracked.on_first_frame = lambda: loop.call_soon_threadsafe(_first_audio, player, site, requested_at)
+    vc.stop()
+    vc.play(source, after=_after)
+    player.source = tracked
+    if player.watchdog and player.watchdog is not asyncio.current_task():
+        player.watchdog.cancel()
+    player.watchdog = None if info.get("local") else loop.create_task(_watch_stream(ctx, player, tracked, gen))
+    audio_cache.fetch_later(_video_id(info.get("webpage_url")), info)
+
+def _first_audio(player: GuildPlayer, site: str, requested_at: float | None):
+    now = time.monotonic()
+    if player.ended_at is not None:
+        metrics.observe("inter_track_gap_seconds", now - player.ended_at)
+        player.ended_at = None
+    elif requested_at is not None:
+        metrics.observe("time_to_first_audio_seconds", now - requested_at, site=site)
+
+def _start_track(ctx, info: dict, url: str, requester_id: int | None, offset: float | None = None,
+                 requested_at: float | None = None):
+    """Make `info` the guild's current track and start it."""
+    player = get_player(ctx.guild.id)
+
+    # --- store metadata for nowplaying/seek ---
+    player.webpage_url = info.get("webpage_url") or url
+    player.title = info.get("title", "Unknown")
+    player.duration = info.get("duration")
+    player.thumbnail = info.get("thumbnail") or (info.get("thumbnails") or [{}])[-1].get("url")
+    player.requester_id = requester_id
+    player.text_channel_id = getattr(ctx.channel, "id", player.text_channel_id)
+    player.refreshes = 0
+    audio_cache.played(_video_id(player.webpage_url))
+
+    # start playback
+    _play_info(ctx, info, offset, requested_at)
+    schedule_prefetch(player)
+    _state_changed(player, queue=False)
+
+async def _loop_restart(ctx):
+    """Restart the current track for loop (cached stream URL when still valid)."""
+    _call_site.set("loop")
+    vc = ctx.voice_client
+    # If we lost VC, bail quietly
+    if not vc or not vc.is_connected():
+        return
+    try:
+        info = await resolve_playback(get_player(ctx.guild.id).webpage_url)
+        _play_info(ctx, info)
+    except Exception as ee:
+        print("Loop re-extract/play failed:", ee)
+
+async def _restart_at_position(ctx, fresh: bool = False):
+    """
+    Restart the current track where the listener is now (new ffmpeg gain, dead
+    stream URL...). `fresh` drops the cached stream URL first.
+    """
+    player = get_player(ctx.guild.id)
+    vc = ctx.voice_client
+    if not player.webpage_url or not vc or not vc.is_connected():
+        return
+    requested_at = time.monotonic()
+    position = player.position()
+    if fresh:
+        stream_cache.pop((player.webpage_url, STREAM_PROFILE))
+    try:
+        info = await resolve_playback(player.webpage_url)
+    except Exception as e:
+        print(f"Restart at {_fmt_time(position)} failed:", e)
+        if fresh:
+            await _abandon_track(ctx)
+        return
+    paused = vc.is_paused()
+    _play_info(ctx, info, position, requested_at)
+    if paused:
+        vc.pause()
+
+
+# --- stall watchdog ---
+# Each streamed track gets a small task that checks the TrackedSource every few
+# seconds. A read that hangs, a read rate well under real time, or an HTTP 4xx
+# from ffmpeg swaps in a freshly extracted URL at the current position; so does
+# ffmpeg hitting EOF well before the known duration.
+STALL_CHECK_INTERVAL = 2.0
+STALL_TIMEOUT = _env_float("ATHENA_STALL_TIMEOUT", 10.0)  # seconds without a frame while playing
+STALL_MIN_RATE = 0.75        # fraction of real time below which a check window counts as slow
+STALL_SLOW_WINDOWS = 3       # consecutive slow windows before refreshing
+STALL_MAX_REFRESHES = _env_int("ATHENA_STALL_MAX_REFRESHES", 3)  # per track, before skipping it
+STALL_HEALTHY_AFTER = 60.0   # seconds of clean playback that earn the refresh budget back
+EARLY_EOF_SLACK = 5.0        # EOF this close to the duration is a normal ending
+
+
+def _ended_early(player: GuildPlayer, tracked: TrackedSource, info: dict) -> bool:
+    if info.get("local") or not player.duration:
+        return False
+    return tracked.position < player.duration - EARLY_EOF_SLACK
+
+async def _abandon_track(ctx):
+    """Drop the current (dead) stream and move on to the next queued track."""
+    player = get_player(ctx.guild.id)
+    old = player.source
+    player.generation += 1  # the stopped source's after() mustn't advance the queue too
+    if ctx.voice_client:
+        ctx.voice_client.stop()
+    if old:
+        old.cleanup()  # a hung read only returns once its ffmpeg is gone
+    await play_next_in_queue(ctx)
+
+async def _refresh_stream(ctx, gen: int, reason: str):
+    """Swap a stalled/dead stream for a freshly extracted URL at the current position."""
+    _call_site.set("refresh")
+    player = get_player(ctx.guild.id)
+    vc = ctx.voice_client
+    if gen != player.generation or not vc or not vc.is_connected():
+        return  # already restarted/stopped by something else
+    old = player.source
+    if player.refreshes >= STALL_MAX_REFRESHES:
+        print(f"[watchdog] giving up on {player.title!r} ({reason})")
+        metrics.inc("stream_giveups_total")
+        await _abandon_track(ctx)
+        return
+    player.refreshes += 1
+    metrics.inc("stream_refreshes_total")
+    print(f"[watchdog] {player.title!r}: {reason}; resuming at {_fmt_time(player.position())} on a fresh URL")
+    await _restart_at_position(ctx, fresh=True)
+    if old:
+        old.cleanup()  # a hung read only returns once its ffmpeg is gone
+
+async def _watch_stream(ctx, player: GuildPlayer, tracked: TrackedSource, gen: int):
+    slow = 0
+    last_frames = tracked.frames
+    checked = time.monotonic()
+    while True:
+        await asyncio.sleep(STALL_CHECK_INTERVAL)
+        vc = ctx.voice_client
+        if gen != player.generation or tracked.eof or not vc:
+            return
+        now = time.monotonic()
+        if not vc.is_connected() or not vc.is_playing():
+            # paused or reconnecting: nothing is read, so don't count it as a stall
+            tracked.last_read, last_frames, slow, checked = now, tracked.frames, 0, now
+            continue
+        prev = last_frames
+        got, last_frames = tracked.frames - prev, tracked.frames
+        missed = (now - checked) / FRAME_SECONDS - got  # frames real time wanted but ffmpeg didn't deliver
+        checked = now
+        if prev and missed >= 2:
+            metrics.inc("audio_frames_missed_total", int(missed))
+        slow = slow + 1 if got < STALL_MIN_RATE * STALL_CHECK_INTERVAL / FRAME_SECONDS else 0
+
+        if tracked.stream_error:
+            reason = tracked.stream_error
+        elif now - tracked.last_read > STALL_TIMEOUT:
+            reason = f"no audio for {now - tracked.last_read:.0f}s"
+        elif slow >= STALL_SLOW_WINDOWS and tracked.frames:
+            reason = f"reading at {got * FRAME_SECONDS / STALL_CHECK_INTERVAL:.0%} of real time"
+        else:
+            if tracked.frames * FRAME_SECONDS > STALL_HEALTHY_AFTER:
+                player.refreshes = 0
+            continue
+        await _refresh_stream(ctx, gen, reason)
+        return
+
+
+# --- idle reaper ---
+# Every REAPER_INTERVAL seconds: leave voice channels that have had nothing playing
+# (or nobody listening) for a while, kill ffmpeg processes no guild is playing
+# from any more, drop GuildPlayers that hold nothing but defaults, and purge
+# expired cache entries. Memory, UDP sockets and child processes then follow the
+# guilds that are actually in use.
+REAPER_INTERVAL = _env_float("ATHENA_REAPER_INTERVAL", 60.0)
+IDLE_TIMEOUT = _env_float("ATHENA_IDLE_TIMEOUT", 300.0)    # nothing playing -> leave voice (0 = never)
+ALONE_TIMEOUT = _env_float("ATHENA_ALONE_TIMEOUT", 120.0)  # no listeners left -> leave voice (0 = never)
+ORPHAN_GRACE = 30.0  # seconds an ffmpeg no guild is playing from may linger before it's killed
+
+_reaper_task = None
+
+
+def _ffmpeg_alive(src: TrackedSource) -> bool:
+    proc = getattr(src.original, "_process", None)  # discord.py's Popen; MISSING once cleaned up
+    return hasattr(proc, "poll") and proc.poll() is None
+
+def _reap_ffmpeg() -> int:
+    """Kill ffmpeg children that no guild is playing from; returns how many."""
+    current = {p.source for p in players.values() if _is_active(p)}
+    current.update(s.feed.tracked for s in stations.values() if s.feed)
+    cutoff = time.monotonic() - ORPHAN_GRACE
+    killed = 0
+    for src in list(_ffmpeg_sources):
+        if not _ffmpeg_alive(src):
+            _ffmpeg_sources.discard(src)
+        elif src not in current and src.last_read < cutoff:
+            src.cleanup()
+            _ffmpeg_sources.discard(src)
+            killed += 1
+    return killed
+
+async def _reap_voice(now: float) -> int:
+    """Disconnect voice clients that have been idle or alone too long; returns how many."""
+    left = 0
+    for vc in list(bot.voice_clients):
+        player = get_player(vc.guild.id)
+        members = getattr(vc.channel, "members", None) or []
+        alone = not any(not m.bot for m in members)
+        if (vc.is_playing() or vc.is_paused()) and not alone:
+            player.idle_since = None
+            continue
+        if player.idle_since is None:
+            player.idle_since = now
+            continue
+        limit = ALONE_TIMEOUT if alone else IDLE_TIMEOUT
+        if limit <= 0 or now - player.idle_since < limit:
+            continue
+        try:
+            await vc.disconnect()
+        except Exception as e:
+            print(f"[reaper] disconnect from {vc.guild.id} failed: {e}")
+            continue
+        left += 1
+        player.idle_since = None
+        channel = bot.get_channel(player.text_channel_id) if player.text_channel_id else None
+        why = "nobody was listening" if alone else "nothing was playing"
+        notify(channel, f"Left the voice channel since {why} for a while.")
+    return left
+
+def _evict_players(now: float) -> int:
+    """Drop GuildPlayers with no voice client and nothing worth keeping; returns how many."""
+    evicted = 0
+    for guild_id, player in list(players.items()):
+        guild = bot.get_guild(guild_id)
+        if guild is not None and guild.voice_client is not None:
+            continue
+        if player.queue or player.looping or player.volume != 1.0 or player.lock.locked():
+            player.idle_since = None  # has state someone will want back
+            continue
+        if player.idle_since is None:
+            player.idle_since = now  # give in-flight commands a full timeout first
+            continue
+        if now - player.idle_since < IDLE_TIMEOUT:
+            continue
+        if player.watchdog:
+            player.watchdog.cancel()
+        if player.prefetch:
+            player.prefetch[0].cancel()
+            player.prefetch = None
+        drop_hydration(guild_id)
+        del players[guild_id]
+        if STATE_DB:
+            _dirty_players.add(guild_id)  # the flush drops its saved row
+        evicted += 1
+    return evicted
+
+async def _reaper():
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        try:
+            now = time.monotonic()
+            left = await _reap_voice(now)
+            killed = _reap_ffmpeg()
+            evicted = _evict_players(now)
+            _prune_outboxes(now)
+            _reap_stations(now)
+            for cache in (stream_cache, search_cache, search_results, member_names):
+                cache.purge()
+            metrics.inc("reaper_voice_disconnects_total", left)
+            metrics.inc("reaper_ffmpeg_killed_total", killed)
+            metrics.inc("reaper_players_evicted_total", evicted)
+            if left or killed or evicted:
+                print(f"[reaper] left {left} voice channels, killed {killed} ffmpeg, evicted {evicted} guilds")
+        except Exception as e:
+            print(f"[reaper] pass failed: {e}")
+
+
+# --- broadcast ---
+# For event nights: a named station plays its own queue once, and any number of
+# guilds tune in to it. One ffmpeg per track decodes (or, for Opus sources, just
+# copies) the stream into a ring of Opus frames, paced at real time by a pump
+# thread; every tuned-in voice client plays a StationListener that reads the ring
+# at its own cursor. Listeners joining mid-track start at the live edge, and one
+# that falls more than the ring behind skips ahead (dropping frames) instead of
+# holding anyone else up. CPU, extraction and upstream bandwidth then scale with
+# stations, not listeners. Per-guild volume doesn't apply to broadcasts.
+BROADCAST_BUFFER = _env_float("ATHENA_BROADCAST_BUFFER", 10.0)  # seconds of frames kept per station
+BROADCAST_PREBUFFER = 25  # frames the pump may run ahead of real time (and listeners start behind the head)
+OPUS_SILENCE = b"\xf8\xff\xfe"  # what discord.py itself sends to keep a connection alive
+
+stations = {}  # lowercased name -> Station
+
+
+class BroadcastFeed:
+    """One track's ffmpeg, pumped into a ring of Opus frames by a daemon thread."""
+
+    def __init__(self, info: dict, offset: float | None, loop):
+        _, self.tracked = _make_source(info, 1.0, offset, mode="opus")
+        self.size = max(int(BROADCAST_BUFFER / FRAME_SECONDS), 4 * BROADCAST_PREBUFFER)
+        self.ring = [b""] * self.size
+        self.head = 0  # sequence number of the next frame; frame n lives in ring[n % size]
+        self.closed = False
+        self.done = loop.create_future()
+        self._loop = loop
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    def _pump(self):
+        started = time.perf_counter()
+        try:
+            while not self.closed:
+                data = self.tracked.read()
+                if not data:
+                    break
+                self.ring[self.head % self.size] = data
+                self.head += 1
+                delay = started + (self.head - BROADCAST_PREBUFFER) * FRAME_SECONDS - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            print(f"[broadcast] pump failed: {e}")
+        finally:
+            self.tracked.cleanup()
+            _ffmpeg_sources.discard(self.tracked)
+            try:
+                self._loop.call_soon_threadsafe(lambda: self.done.done() or self.done.set_result(None))
+            except RuntimeError:
+                pass  # loop already closed on shutdown
+
+    def live_edge(self) -> int:
+        return max(0, self.head - BROADCAST_PREBUFFER)
+
+    def close(self):
+        self.closed = True
+        self.tracked.cleanup()
+
+
+class StationListener(discord.AudioSource):
+    """What a tuned-in voice client plays: the station's frames, read at this guild's own pace."""
+
+    def __init__(self, station, guild_id: int, channel):
+        self.station = station
+        self.guild_id = guild_id
+        self.channel = channel  # where now-playing notices go
+        self.feed = None
+        self.cursor = 0
+        self.dropped = 0
+
+    def is_opus(self) -> bool:
+        return True
+
+    def read(self) -> bytes:
+        station = self.station
+        if station.closed:
+            return b""
+        feed = station.feed
+        if feed is None:
+            return OPUS_SILENCE  # between tracks; stay connected
+        if feed is not self.feed:
+            self.feed = feed
+            self.cursor = feed.live_edge()
+        head = feed.head
+        if self.cursor >= head:
+            return OPUS_SILENCE  # caught up with the pump (slow upstream)
+        # keep clear of the slots the pump is about to overwrite
+        if head - self.cursor > feed.size - BROADCAST_PREBUFFER:
+            skip = feed.live_edge() - self.cursor
+            self.cursor += skip
+            self.dropped += skip
+            station.loop.call_soon_threadsafe(metrics.inc, "broadcast_frames_dropped_total", skip)
+        data = feed.ring[self.cursor % feed.size]
+        self.cursor += 1
+        return data
+
+    def cleanup(self):
+        self.station.listeners.discard(self)
+
+
+class Station:
+    __slots__ = ("name", "queue", "listeners", "feed", "title", "duration", "webpage_url",
+                 "closed", "task", "loop", "idle_since")
+
+    def __init__(self, name: str, loop):
+        self.name = name
+        self.queue = deque()
+        self.listeners = set()
+        self.feed = None
+        self.title = None
+        self.duration = None
+        self.webpage_url = None
+        self.closed = False
+        self.task = None
+        self.loop = loop
+        self.idle_since = None
+
+    def position(self) -> float:
+        return self.feed.tracked.position if self.feed else 0.0
+
+    def enqueue(self, track: Track):
+        self.queue.append(track)
+        if self.task is None or self.task.done():
+            self.task = self.loop.create_task(self._run())
+
+    def _announce(self, text: str):
+        for listener in list(self.listeners):
+            announce_now_playing(listener.channel, text)
+
+    async def _play(self, track: Track):
+        info = await resolve_playback(track.url, profile="stream_opus")
+        self.title = info.get("title") or track.title or "Unknown"
+        self.duration = info.get("duration")
+        self.webpage_url = info.get("webpage_url") or track.url
+        self._announce(f"Now playing on **{self.name}**: {self.title}")
+        offset, refreshes = None, 0
+        while not self.closed:
+            self.feed = feed = BroadcastFeed(info, offset, self.loop)
+            while not feed.done.done():
+                await asyncio.wait([feed.done], timeout=STALL_CHECK_INTERVAL)
+                if not feed.done.done() and time.monotonic() - feed.tracked.last_read > STALL_TIMEOUT:
+                    print(f"[broadcast] {self.name}: no audio for {STALL_TIMEOUT:g}s, restarting ffmpeg")
+                    feed.close()  # the pump sees EOF and finishes
+            early = (not info.get("local") and self.duration
+                     and feed.tracked.position < self.duration - EARLY_EOF_SLACK)
+            if self.closed or not (feed.tracked.stream_error or early) or refreshes >= STALL_MAX_REFRESHES:
+                return
+            refreshes += 1
+            offset = feed.tracked.position
+            metrics.inc("stream_refreshes_total", reason="broadcast")
+            stream_cache.pop((self.webpage_url, "stream_opus"))
+            info = await resolve_playback(self.webpage_url, profile="stream_opus")
+
+    async def _run(self):
+        _call_site.set("broadcast")
+        while self.queue and not self.closed:
+            track = self.queue.popleft()
+            try:
+                await self._play(track)
+            except Exception as e:
+                print(f"[broadcast] {self.name}: couldn't play {track.url}: {e}")
+                self._announce(f"**{self.name}** couldn't play **{track.title or track.url}**, skipping it.")
+            finally:
+                self.feed = None
+        self.title = self.duration = self.webpage_url = None
+
+    def close(self):
+        self.closed = True
+        if self.feed:
+            self.feed.close()
+        if self.task:
+            self.task.cancel()
+        stations.pop(self.name.lower(), None)
+
+
+def _listener(vc) -> StationListener | None:
+    source = getattr(vc, "source", None) if vc else None
+    return source if isinstance(source, StationListener) else None
+
+def _reap_stations(now: float) -> int:
+    """Close stations nobody has listened to, or nothing has played on, for IDLE_TIMEOUT; returns how many."""
+    closed = 0
+    for station in list(stations.values()):
+        on_air = station.queue or (station.task is not None and not station.task.done())
+        if (station.listeners and on_air) or IDLE_TIMEOUT <= 0:
+            station.idle_since = None
+        elif station.idle_since is None:
+            station.idle_since = now
+        elif now - station.idle_since >= IDLE_TIMEOUT:
+            # listeners read b"" once closed, so their voice clients go idle and get reaped too
+            station._announce(f"Nothing has played on **{station.name}** for a while, closing it.")
+            station.close()
+            closed += 1
+    return closed
+
+
+# --- metrics export ---
+_metrics_tasks = []
+
+
+def _gauges() -> dict:
+    return {
+        "guild_players": len(players),
+        "voice_connections": len(bot.voice_clients),
+        "playing": sum(1 for p in players.values() if _is_active(p)),
+        "ffmpeg_processes": sum(1 for src in _ffmpeg_sources if _ffmpeg_alive(src)),
+        "queued_tracks": sum(len(p.queue) for p in players.values()),
+        "extractions_in_flight": len(_inflight),
+        "notice_outboxes": len(_outboxes),
+        "broadcast_stations": len(stations),
+        "broadcast_listeners": sum(len(s.listeners) for s in stations.values()),
+    }
+
+def _caches() -> dict:
+    return {"stream": stream_cache, "search": search_cache, "search_pick": search_results,
+            "video_meta": video_meta, "audio": audio_cache, "member_names": member_names}
+
+def _label_str(pairs) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+def render_prometheus() -> str:
+    """Everything in Prometheus' text exposition format."""
+    lines = [f"athena_uptime_seconds {time.time() - metrics.started:.0f}"]
+    for (name, pairs), value in sorted(metrics.counters.items()):
+        lines.append(f"athena_{name}{_label_str(pairs)} {value:g}")
+    for (name, pairs), hist in sorted(metrics.histograms.items()):
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), hist.counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"athena_{name}_bucket{_label_str(pairs + (('le', le),))} {cumulative}")
+        lines.append(f"athena_{name}_sum{_label_str(pairs)} {hist.sum:.6f}")
+        lines.append(f"athena_{name}_count{_label_str(pairs)} {hist.count}")
+    for name, value in _gauges().items():
+        lines.append(f"athena_{name} {value}")
+    for name, cache in _caches().items():
+        lines.append(f'athena_cache_hits_total{{cache="{name}"}} {cache.hits}')
+        lines.append(f'athena_cache_misses_total{{cache="{name}"}} {cache.misses}')
+    for player in players.values():
+        if player.queue:
+            lines.append(f'athena_queue_depth{{guild="{player.guild_id}"}} {len(player.queue)}')
+    return "\n".join(lines) + "\n"
+
+def snapshot_metrics() -> dict:
+    """Same data as render_prometheus, as plain JSON-able dicts (histograms as quantiles)."""
+    return {
+        "time": time.time(),
+        "uptime": time.time() - metrics.started,
+        "counters": [{"name": name, "labels": dict(pairs), "value": value}
+                     for (name, pairs), value in metrics.counters.items()],
+        "histograms": [{"name": name, "labels": dict(pairs), "count": h.count, "sum": h.sum,
+                        "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99)}
+                       for (name, pairs), h in metrics.histograms.items()],
+        "gauges": _gauges(),
+        "caches": {name: {"hits": c.hits, "misses": c.misses} for name, c in _caches().items()},
+        "queue_depth": {str(p.guild_id): len(p.queue) for p in players.values() if p.queue},
+    }
+
+async def _serve_metrics(reader, writer):
+    """Minimal HTTP: any request gets the Prometheus text."""
+    try:
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5.0)
+        body = render_prometheus().encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                     b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+def _write_json(path: str, data: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+async def _metrics_dumper():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(METRICS_JSON_INTERVAL)
+        try:
+            await loop.run_in_executor(None, _write_json, METRICS_JSON, snapshot_metrics())
+        except Exception as e:
+            print(f"[metrics] dump failed: {e}")
+
+async def start_metrics():
+    """Open the metrics endpoint / start the JSON dump, once."""
+    if _metrics_tasks:
+        return
+    loop = asyncio.get_running_loop()
+    if METRICS_PORT:
+        try:
+            server = await asyncio.start_server(_serve_metrics, METRICS_HOST, METRICS_PORT)
+            _metrics_tasks.append(server)
+            print(f"[metrics] serving on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"[metrics] can't listen on {METRICS_HOST}:{METRICS_PORT}: {e}")
+    if METRICS_JSON:
+        _metrics_tasks.append(loop.create_task(_metrics_dumper()))
+
+
+def _fmt_latency(sec) -> str:
+    if sec is None:
+        return "-"
+    if sec == float("inf"):
+        return f">{LATENCY_BUCKETS[-1]:g}s"
+    return f"{sec * 1000:.0f}ms" if sec < 1 else f"{sec:g}s"
+
+@bot.before_invoke
+async def _command_started(ctx):
+    ctx.started_at = time.monotonic()
+
+@bot.after_invoke
+async def _command_finished(ctx):
+    started = getattr(ctx, "started_at", None)
+    if started is not None and ctx.command:
+        metrics.observe("command_seconds", time.monotonic() - started, command=ctx.command.name)
+
+@bot.command()
+@commands.is_owner()
+async def stats(ctx):
+    """Runtime metrics (bot owner only)."""
+    g = _gauges()
+    deepest = max((len(p.queue) for p in players.values()), default=0)
+    lines = [
+        f"Up {_fmt_time(time.time() - metrics.started)} • {len(bot.guilds)} guilds • "
+        f"{g['voice_connections']} voice • {g['playing']} playing • {g['ffmpeg_processes']} ffmpeg",
+        f"Queued {g['queued_tracks']} tracks (deepest {deepest}) • {g['extractions_in_flight']} extractions in flight",
+        "",
+        "p50 / p95 (count):",
+    ]
+    for (name, pairs), h in sorted(metrics.histograms.items()):
+        label = ",".join(str(v) for _, v in pairs)
+        lines.append(f"  {name}{f'[{label}]' if label else ''}: "
+                     f"{_fmt_latency(h.quantile(0.5))} / {_fmt_latency(h.quantile(0.95))} ({h.count})")
+    lines += ["", "Cache hit rates:"]
+    for name, c in _caches().items():
+        total = c.hits + c.misses
+        lines.append(f"  {name}: {c.hits / total:.0%} of {total}" if total else f"  {name}: -")
+    counters = [(name, pairs, v) for (name, pairs), v in sorted(metrics.counters.items()) if v]
+    if counters:
+        lines += ["", "Counters:"]
+        lines += [f"  {name}{_label_str(pairs)}: {v:g}" for name, pairs, v in counters]
+    text = "\n".join(lines)
+    await ctx.send(f"```{text[:1900]}```")
+
 
 @bot.command()
 async def join(ctx):
@@ -143,7 +2933,7 @@ async def join(ctx):
     if not perms.speak:
         return await ctx.send(f"I don't have **Speak** permission in {channel.mention}.")
 
-    lock = get_guild_lock(ctx.guild.id)
+    lock = get_player(ctx.guild.id).lock
     async with lock:
         vc = ctx.voice_client
         try:
@@ -219,9 +3009,10 @@ async def skip(ctx):
 @bot.command()
 async def loop(ctx):
     """Enable looping of current song."""
-    global looping
-    looping = not looping
-    await ctx.send(f"Playback loop has been {'enabled' if looping else 'disabled'}.")
+    player = get_player(ctx.guild.id)
+    player.looping = not player.looping
+    _state_changed(player, queue=False)
+    await ctx.send(f"Playback loop has been {'enabled' if player.looping else 'disabled'}.")
 
 @bot.command()
 async def nowplaying(ctx):
@@ -229,28 +3020,37 @@ async def nowplaying(ctx):
     vc = ctx.voice_client
     if not vc or not (vc.is_playing() or vc.is_paused()):
         return await ctx.send("No current playback.")
+    listener = _listener(vc)
+    if listener:
+        station = listener.station
+        if not station.title:
+            return await ctx.send(f"Tuned in to **{station.name}**, nothing on air right now.")
+        return await ctx.send(f"Tuned in to **{station.name}**: {station.title} "
+                              f"({_progress_bar(station.position(), station.duration)})")
     
-    if not current_title:
+    player = get_player(ctx.guild.id)
+    if not player.title:
         return await ctx.send("Please wait. No available metadata as of yet.")
     
     status = "Paused." if vc.is_paused() else "Playing."
-    duration_str = _fmt_time(current_duration)
+    duration_str = _fmt_time(player.duration)
 
     embed = discord.Embed(
         title="Now Playing",
-        description=f"[{current_title}]({current_webpage_url})" if current_webpage_url else current_title,
+        description=f"[{player.title}]({player.webpage_url})" if (player.webpage_url or "").startswith("http") else player.title,
         color=0x5865F2,
     )
     embed.add_field(name="Status", value =status, inline=True)
     embed.add_field(name="Duration", value=duration_str, inline=True)
+    embed.add_field(name="Progress", value=_progress_bar(player.position(), player.duration), inline=False)
 
-    if current_requester_id:
-        member = ctx.guild.get_member(current_requester_id)
+    if player.requester_id:
+        member = ctx.guild.get_member(player.requester_id)
         if member:
             embed.add_field(name="Requested by: ", value=member.mention, inline=True)
 
-    if current_thumbnail:
-        embed.set_thumbnail(url=current_thumbnail)
+    if player.thumbnail:
+        embed.set_thumbnail(url=player.thumbnail)
 
     embed.set_footer(text=f"{ctx.guild.name}")
 
@@ -258,22 +3058,23 @@ async def nowplaying(ctx):
 
 @bot.command()
 async def search(ctx, *, query: str):
-    """Search YouTube and list the top 5 results (plain text)."""
-    import yt_dlp as youtube_dl
-    import asyncio
-
-    async with ctx.typing():
-        def _extract():
-            opts = {**YDL_SEARCH_OPTS, "default_search": "ytsearch5"}
-            with youtube_dl.YoutubeDL(opts) as ydl:
-                info = ydl.extract_info(query, download=False)
-                entries = info.get("entries", []) if info else []
-                return entries[:5]
-
-        try:
-            results = await asyncio.get_running_loop().run_in_executor(None, _extract)
-        except Exception as e:
-            return await ctx.send(f" Search failed: {e}")
+    """Search the local library, or YouTube when nothing there matches, and list the top 5 results (plain text)."""
+    _call_site.set("search")
+    key = _normalize_query(query)
+    results = [dict(library.info(t), path=os.path.basename(t.path)) for _, t in library.search(query, 5)]
+    if not results:
+        results = search_cache.get(key)
+    if results is None:
+        async with ctx.typing():
+            try:
+                info = await extract_info(key, "search")
+            except Exception as e:
+                return await ctx.send(f" Search failed: {e}")
+            results = (info.get("entries", []) if info else [])[:5]
+            for e in results:
+                _remember_meta(e)
+            if results:
+                search_cache.set(key, results)
 
     if not results:
         return await ctx.send(" No results found.")
@@ -286,6 +3087,7 @@ async def search(ctx, *, query: str):
         dur = _fmt_time(e.get("duration"))
         uploader = e.get("uploader") or e.get("channel") or ""
         url = e.get("webpage_url") or e.get("url")
+        where = f"{url} • {e['path']}" if e.get("path") else url  # library hit: show the file
 
         final_results.append({
             "title": title,
@@ -294,10 +3096,10 @@ async def search(ctx, *, query: str):
             "webpage_url": url,
         })
 
-        line = f"{i}. {title} ({dur}{' • ' + uploader if uploader else ''})\n{url}"
+        line = f"{i}. {title} ({dur}{' • ' + uploader if uploader else ''})\n{where}"
         out.append(line)
 
-    search_results[(ctx.guild.id, ctx.author.id)] = final_results
+    search_results.set((ctx.guild.id, ctx.author.id), final_results)
 
     msg = "\n\n".join(out)
     await ctx.send(f"**Search results for:** {query}\nUse `&pick 1-5` to choose:\n```{msg}```")
@@ -333,12 +3135,13 @@ async def pick(ctx, index: int):
 
 @bot.command()
 async def vol(ctx, percent: int | None = None):
-    """Get/Set global volume for the bot. Volume values go from 0 - 200. """
+    """Get/Set the volume for this server. Volume values go from 0 - 200. """
+    _call_site.set("vol")
 
-    global volume
+    player = get_player(ctx.guild.id)
 
     if percent is None:
-        cur = int(round(volume * 100))
+        cur = int(round(player.volume * 100))
         return await ctx.send(f"Current volume: **{cur}%**")
 
     try:
@@ -346,8 +3149,14 @@ async def vol(ctx, percent: int | None = None):
     except ValueError:
         return await ctx.send("Please enter a whole number between 0 and 200.")
 
+    if _listener(ctx.voice_client):
+        # every listener shares the station's one encode, so there's no per-server gain to change
+        return await ctx.send("Volume can't be changed while tuned in to a broadcast; "
+                              "use Discord's user volume instead.")
+
     p = _clamp(percent, 0, 200)
-    volume = p / 100.0
+    player.volume = p / 100.0
+    _state_changed(player, queue=False)
 
     #adjust volume live if playing
 
@@ -355,9 +3164,12 @@ async def vol(ctx, percent: int | None = None):
     if vc and vc.source:
         try:
             if isinstance(vc.source, discord.PCMVolumeTransformer):
-                vc.source.volume = volume
+                vc.source.volume = player.volume
+            elif vc.source.is_opus():
+                # gain lives in ffmpeg here; restart it at the current offset
+                await _restart_at_position(ctx)
             else:
-                vc.source = discord.PCMVolumeTransformer(vc.source, volume=volume)
+                vc.source = discord.PCMVolumeTransformer(vc.source, volume=player.volume)
         except Exception:
             pass
 
@@ -365,84 +3177,165 @@ async def vol(ctx, percent: int | None = None):
 
 @bot.command()
 async def seek(ctx, position: str):
-    """Jump to a timestamp in the current track. Accepts seconds, m:s and h:m:s """
+    """Jump to a timestamp in the current track. Accepts seconds, m:s and h:m:s, or +/- to jump relative """
+    _call_site.set("seek")
+    requested_at = time.monotonic()
     vc = ctx.voice_client
     if not vc or not (vc.is_playing() or vc.is_paused()):
         return await ctx.send(" Nothing is playing.")
 
     # parse time
-    seconds = _parse_timestamp(position)
+    sign = position[:1] if position[:1] in "+-" else ""
+    seconds = _parse_timestamp(position[1:] if sign else position)
     if seconds is None or seconds < 0:
-        return await ctx.send(" Time must be SS, MM:SS, or HH:MM:SS.")
+        return await ctx.send(" Time must be SS, MM:SS, or HH:MM:SS (prefix with + or - to jump from here).")
+
+    player = get_player(ctx.guild.id)
+    if sign:
+        seconds = player.position() + (seconds if sign == "+" else -seconds)
+    seconds = max(0.0, seconds)
+    if player.duration and seconds >= player.duration:
+        return await ctx.send(f" That's past the end of the track ({_fmt_time(player.duration)}).")
 
     # we need to know what to re-extract (page URL). If missing, bail nicely.
-    if not current_webpage_url:
+    if not player.webpage_url:
         return await ctx.send("I don't have the source URL for this track. Try playing it again, then seek.")
 
-    # re-extract a fresh direct audio URL (avoids expired links)
+    # direct audio URL, cached until shortly before it expires
     try:
-        with youtube_dl.YoutubeDL(YDL_SEARCH_OPTS) as ydl:
-            info = ydl.extract_info(current_webpage_url, download=False)
-            stream_url = info["url"]
+        info = await resolve_playback(player.webpage_url)
     except Exception as e:
         return await ctx.send(f"Couldn't refresh the stream: {e}")
 
     # restart FFmpeg from the desired offset
     try:
-        before = f"-ss {seconds} -reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
-        ffmpeg_opts = "-vn"
-        vc.stop()
-        vc.play(
-            discord.FFmpegPCMAudio(stream_url, before_options=before, options=ffmpeg_opts),
-            after=lambda e: print(f"[seek] ffmpeg error: {e}") if e else None
-        )
-        await ctx.send(f"Seeked to **{position}**.")
+        paused = vc.is_paused()
+        _play_info(ctx, info, seconds, requested_at)
+        if paused:
+            vc.pause()
+        await ctx.send(f"Seeked to **{_fmt_time(seconds)}**.")
     except Exception as e:
         await ctx.send(f"Seek failed: {e}")
 
 
+# --- queue view ---
+# Only the requested page is read from the queue (O(log n + page)), and requester
+# names are cached so paging doesn't hit the member cache for every line.
+QUEUE_PAGE_SIZE = 10
+QUEUE_VIEW_TIMEOUT = 120.0
+
+member_names = TTLCache(4096, 600.0)  # (guild_id, user_id) -> display name
+
+
+def _member_name(guild, user_id: int | None) -> str:
+    if not user_id:
+        return ""
+    key = (guild.id, user_id)
+    name = member_names.get(key)
+    if name is None:
+        member = guild.get_member(user_id)
+        name = member.display_name if member else ""
+        member_names.set(key, name)
+    return name
+
+def _render_queue_page(guild, player: GuildPlayer, page: int):
+    """(message text, clamped page, page count) for one page of the queue."""
+    q = player.queue
+    pages = max(1, -(-len(q) // QUEUE_PAGE_SIZE))
+    page = _clamp(page, 1, pages)
+    start = (page - 1) * QUEUE_PAGE_SIZE
+
+    # Format each queued song like search results
+    out = []
+    for i, track in enumerate(q.slice(start, start + QUEUE_PAGE_SIZE), start=start + 1):
+        name = _member_name(guild, track.requester_id)
+        requester = f" • {name}" if name else ""
+        dur_str = _fmt_time(track.duration) if track.duration else "Unknown"
+        title = (track.title or "Unknown")[:80]
+        out.append(f"{i}. {title} ({dur_str}{requester})\n{track.url}")
+
+    unknown = f" (+{q.unknown} unknown)" if q.unknown else ""
+    remaining = q.total_duration
+    if player.duration:
+        remaining += max(0.0, player.duration - player.position())
+    header = (
+        f"**Current Queue ({len(q)} tracks) — page {page}/{pages}**\n"
+        f"Total: {_fmt_time(q.total_duration)}{unknown} • Time left incl. current: {_fmt_time(remaining)}{unknown}"
+    )
+    msg = "\n\n".join(out)
+    return f"{header}\n```{msg}```", page, pages
+
+
+class QueueView(discord.ui.View):
+    """Prev/next buttons under a queue page."""
+
+    def __init__(self, guild, player: GuildPlayer, page: int, pages: int):
+        super().__init__(timeout=QUEUE_VIEW_TIMEOUT)
+        self.guild = guild
+        self.player = player
+        self.page = page
+        self._update_buttons(pages)
+
+    def _update_buttons(self, pages: int):
+        self.prev_page.disabled = self.page <= 1
+        self.next_page.disabled = self.page >= pages
+
+    async def _show(self, interaction: discord.Interaction):
+        content, self.page, pages = _render_queue_page(self.guild, self.player, self.page)
+        self._update_buttons(pages)
+        await interaction.response.edit_message(content=content, view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        await self._show(interaction)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await self._show(interaction)
+
+
 @bot.command()
-async def queue(ctx):
-    """Displays the current queue."""
+async def queue(ctx, page: int = 1):
+    """Displays the current queue, one page at a time."""
 
-    q = queues[ctx.guild.id]
-    if not q:
+    player = players.get(ctx.guild.id)
+    if not player or not player.queue:
         return await ctx.send("The queue is currently empty.")
 
-   # Format each queued song like search results
-    out = []
-    for i, (url, title, requester_id, duration) in enumerate(q, start=1):
-        member = ctx.guild.get_member(requester_id)
-        requester = f" • {member.display_name}" if member else ""
-        dur_str = _fmt_time(duration) if duration else "Unknown"
-        line = f"{i}. {title or 'Unknown'} ({dur_str}{requester})\n{url}"
-        out.append(line)
+    content, page, pages = _render_queue_page(ctx.guild, player, page)
+    if pages > 1:
+        await ctx.send(content, view=QueueView(ctx.guild, player, page, pages))
+    else:
+        await ctx.send(content)
 
-    msg = "\n\n".join(out)
-    await ctx.send(f"**Current Queue ({len(q)} tracks):**\n```{msg}```")
 
-       
-    
 @bot.command()
 async def clear(ctx):
     """Clear the current queue."""
-    queues[ctx.guild.id].clear()
+    player = get_player(ctx.guild.id)
+    player.queue.clear()
+    schedule_prefetch(player)
+    _state_changed(player)
     await ctx.send("Queue cleared.")
 
 @bot.command()
 async def shuffle(ctx):
-    q = queues[ctx.guild.id]
+    player = get_player(ctx.guild.id)
+    q = player.queue
     if not q:
         return await ctx.send("Queue is empty.")
-    tmp = list(q)
-    random.shuffle(tmp)
-    queues[ctx.guild.id] = deque(tmp)
+    q.shuffle()
+    schedule_prefetch(player)
+    _state_changed(player)
     await ctx.send("Queue shuffled.")
 
 @bot.command()
 async def skipto(ctx, index: int):
     """Skip to a specific song in the queue (1 = next up)."""
-    q = queues[ctx.guild.id]
+    player = get_player(ctx.guild.id)
+    q = player.queue
     if not q:
         return await ctx.send("Queue is empty.")
 
@@ -450,14 +3343,15 @@ async def skipto(ctx, index: int):
     if index < 1 or index > n:
         return await ctx.send(f"Index must be between 1 and {n}.")
 
-    # Peek target title for feedback (queue stores 4-tuples)
-    target_url, target_title, _, _ = list(q)[index - 1]
+    # Peek target title for feedback
+    target = q[index - 1]
 
     # Drop items before the chosen index so it becomes the head
-    for _ in range(index - 1):
-        q.popleft()
+    q.drop_front(index - 1)
+    schedule_prefetch(player)
+    _state_changed(player)
 
-    await ctx.send(f"Skipping to **{target_title or 'Unknown'}** (#{index}).")
+    await ctx.send(f"Skipping to **{target.title or 'Unknown'}** (#{index}).")
 
     vc = ctx.voice_client
     if vc and (vc.is_playing() or vc.is_paused()):
@@ -471,75 +3365,130 @@ async def skipto(ctx, index: int):
 @bot.command()
 async def move(ctx, old: int, new: int):
     """Move a track to a different position in the queue."""
-    q = queues[ctx.guild.id]
+    player = get_player(ctx.guild.id)
+    q = player.queue
     if not q:
         return await ctx.send("Queue is empty.")
     if not (1 <= old <= len(q) and 1 <= new <= len(q)):
         return await ctx.send(f"Indexes must be between 1 and {len(q)}.")
-    item = q[old-1]
-    del q[old-1]
+    item = q.pop(old-1)
     q.insert(new-1, item)
-    await ctx.send(f"Moved **{item[1]}** to position {new}.")
+    schedule_prefetch(player)
+    _state_changed(player)
+    await ctx.send(f"Moved **{item.title}** to position {new}.")
 
 @bot.command()
 async def playlist(ctx, url: str, limit: int = 50):
-    """Enqueue a Youtube Playlist, standard limit is 50, goes up to 200. """
+    """Enqueue a Youtube Playlist, standard limit is 50. Playback starts with the first entry. """
 
-    if limit < 1 or limit > 200:
-        return await ctx.send("Limit must be between 1 and 200.")
+    if limit < 1 or limit > PLAYLIST_MAX:
+        return await ctx.send(f"Limit must be between 1 and {PLAYLIST_MAX}.")
     
     if not is_playlist_link(url):
         return await ctx.send("This does not appear to be a playlist link. Please use the regular play command.")
 
-    await ctx.send("Loading playlist, this may take a moment.")
-
-    try:
-        entries = extract_playlist(url, max_items=limit)
-    except Exception as e:
-        return await ctx.send("No playable entries located.")
+    status = await ctx.send("Loading playlist, this may take a moment.")
 
-    q = queues[ctx.guild.id]
+    _call_site.set("playlist")
+    listing_started = time.monotonic()
+    player = get_player(ctx.guild.id)
     added = 0
-    for page_url, title, duration in entries:
-        q.append((page_url,title,ctx.author.id,duration))
-        added += 1
-
-    #if nothing is playing, start playback
+    titles = []
+    started = False
+    failure = None
+    last_edit = time.monotonic()
+    entries = iter_playlist(url, max_items=limit)
+    try:
+        while True:
+            # only a failing listing stops the load; Discord hiccups below don't
+            try:
+                page_url, title, duration = await entries.__anext__()
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                failure = e
+                break
+            if not added:
+                metrics.observe("playlist_first_entry_seconds", time.monotonic() - listing_started)
+            track = Track(page_url, title, ctx.author.id, duration)
+            player.queue.append(track)
+            _state_changed(player)
+            added += 1
+            if duration is None:
+                hydrate_later(player, track)
+            if len(titles) < 5:
+                titles.append(title)
+
+            if not started:
+                #if nothing is playing, start playback with the first entry
+                started = True
+                try:
+                    vc = ctx.voice_client
+                    if not vc:
+                        await ctx.invoke(join)
+                        vc = ctx.voice_client
+                    if vc and not (vc.is_playing() or vc.is_paused()):
+                        await play_next_in_queue(ctx)
+                except Exception as e:
+                    print(f"[playlist] couldn't start playback: {e}")
+            elif time.monotonic() - last_edit >= PLAYLIST_PROGRESS_INTERVAL:
+                last_edit = time.monotonic()
+                try:
+                    await status.edit(content=f"Loading playlist… **{added}** tracks queued so far.")
+                except discord.HTTPException:
+                    pass  # deleted or rate limited; the summary still goes out
+    finally:
+        await entries.aclose()
+    metrics.observe("extract_seconds", time.monotonic() - listing_started, site="playlist", profile="playlist")
+
+    async def finish(content: str):
+        try:
+            await status.edit(content=content)
+        except discord.HTTPException:
+            await ctx.send(content)
 
-    vc = ctx.voice_client
-    if not vc:
-        await ctx.invoke(join)
-        vc = ctx.voice_client
-    if vc and not (vc.is_playing() or vc.is_paused()):
-        await play_next_in_queue(ctx)
+    if not added:
+        return await finish("No playable entries located.")
+    schedule_prefetch(player)
 
     # Nice summary (first few items)
-    preview = "\n".join(f"{i+1}. {entries[i][1]}" for i in range(min(5, len(entries))))
-    more = f"\n… and {len(entries)-5} more." if len(entries) > 5 else ""
-    await ctx.send(f"Added **{added}** tracks to the queue.\n```{preview}{more}```") 
-
-
-
-
+    preview = "\n".join(f"{i+1}. {t}" for i, t in enumerate(titles))
+    more = f"\n… and {added-5} more." if added > 5 else ""
+    note = f"\nStopped early: {failure}" if failure else ""
+    await finish(f"Added **{added}** tracks to the queue.{note}\n```{preview}{more}```")
 
 
 @bot.command()
-async def play(ctx, url: str):
-    """Command to play audio from a YouTube URL."""
-    global looping, current_url
-    global current_title, current_duration, current_webpage_url, current_thumbnail, current_requester_id
+async def play(ctx, *, url: str):
+    """Command to play audio from a YouTube URL (or a track from the local library)."""
+    _call_site.set("play")
+    requested_at = time.monotonic()
+    player = get_player(ctx.guild.id)
+
+    # library tracks by lib:<id> or by name; anything else goes to YouTube
+    local = library.resolve(url)
+    if local is None and url.startswith(LIBRARY_SCHEME):
+        return await ctx.send("That track isn't in the library any more.")
+    if local is not None:
+        url = local.url
 
     vc = ctx.voice_client
-    if vc and (vc.is_playing() or vc.is_paused()):
+    if vc and (vc.is_playing() or vc.is_paused()) and not _listener(vc):
         try:
-            # extract metadata for a single video
-            with youtube_dl.YoutubeDL(YDL_SEARCH_OPTS) as ydl:
-                info = ydl.extract_info(url, download=False)
+            # known videos queue straight from the metadata cache; otherwise
+            # extract (which also warms the stream cache)
+            if local is not None:
+                info = library.info(local)
+            else:
+                vid = _video_id(url)
+                info = (await video_meta.fetch([vid])).get(vid) or await resolve_stream(url)
             link = info.get("webpage_url") or url
             title = info.get("title", "Unknown")
             duration = info.get("duration")
-            queues[ctx.guild.id].append((link, title, ctx.author.id, duration))
-            await ctx.send(f"Added **{title}** to the queue.")
+            player.queue.append(Track(link, title, ctx.author.id, duration))
+            schedule_prefetch(player)
+            _state_changed(player)
+            notify(ctx.channel, f"Added **{title}** to the queue.")
         except Exception as e:
             await ctx.send(f"Failed to queue track: {e}")
         return
@@ -548,75 +3497,92 @@ async def play(ctx, url: str):
         await ctx.invoke(join)  # join first
 
     # --- extract once for initial play ---
-    with youtube_dl.YoutubeDL(YDL_SEARCH_OPTS) as ydl:
-        try:
-            info = ydl.extract_info(url, download=False)
-            stream_url = info["url"]
-            headers = info.get("http_headers") or {}
-        except Exception as e:
-            await ctx.send(f"Error extracting audio: {e}")
-            return
-
-    # --- store metadata for nowplaying/seek ---
-    current_url = info.get("webpage_url") or url
-    current_title = info.get("title", "Unknown")
-    current_duration = info.get("duration")
-    current_webpage_url = current_url
-    current_thumbnail = info.get("thumbnail") or (info.get("thumbnails") or [{}])[-1].get("url")
-    current_requester_id = ctx.author.id
-
-    # --- ffmpeg options (headers + reconnect) ---
-    headers_blob = _headers_str(headers)
-    before = (
-        (f'-headers "{headers_blob}" ' if headers_blob else "")
-        + "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 "
-        + '-user_agent "Mozilla/5.0"'
-    )
-    opts = "-vn -err_detect ignore_err"
+    try:
+        info = library.info(local) if local is not None else await resolve_playback(url)
+    except Exception as e:
+        player.ended_at = None
+        await ctx.send(f"Error extracting audio: {e}")
+        return
 
-    vc = ctx.voice_client
+    _start_track(ctx, info, url, ctx.author.id, requested_at=requested_at)
+    announce_now_playing(ctx.channel, f"Now playing: {player.title}")
 
-    async def _loop_restart():
-        """Re-extract & restart the current track for loop."""
-        # If we lost VC, bail quietly
-        if not vc or not vc.is_connected():
-            return
-        try:
-            with youtube_dl.YoutubeDL(YDL_SEARCH_OPTS) as y2:
-                i2 = y2.extract_info(current_webpage_url, download=False)
-                s2 = i2["url"]
-                h2 = i2.get("http_headers") or {}
-            hb2 = _headers_str(h2)
-            bef2 = (
-                (f'-headers "{hb2}" ' if hb2 else "")
-                + "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 "
-                + '-user_agent "Mozilla/5.0"'
-            )
-            vc.stop()
-            base2 = discord.FFmpegPCMAudio(s2, before_options=bef2, options=opts)
-            src2 = discord.PCMVolumeTransformer(base2, volume=volume)
-            vc.play(src2, after=make_after())
-        except Exception as ee:
-            print("Loop re-extract/play failed:", ee)
-
-    def make_after():
-        def _after(error: Exception | None):
-            if error:
-                print(f"FFmpeg after() error: {error}")
-            elif looping and current_webpage_url:
-                ctx.bot.loop.create_task(_loop_restart())
-            else:
-                # when finished, advance the queue
-                ctx.bot.loop.create_task(play_next_in_queue(ctx))
-        return _after
+@bot.command()
+@commands.is_owner()
+async def broadcast(ctx, name: str = None, *, url: str = None):
+    """Start a station / queue a track on it (`&broadcast <name> <url>`), or list stations."""
+    if name is None:
+        if not stations:
+            return await ctx.send("No stations are on air. Start one with `&broadcast <name> <url>`.")
+        lines = [f"{s.name}: {s.title or 'idle'} ({len(s.listeners)} listening, {len(s.queue)} queued)"
+                 for s in stations.values()]
+        return await ctx.send("```" + "\n".join(lines)[:1900] + "```")
+    station = stations.get(name.lower())
+    if url is None:
+        if station is None:
+            return await ctx.send(f"There's no station called **{name}**.")
+        return await ctx.send(f"**{station.name}**: {station.title or 'idle'}, {len(station.listeners)} listening, "
+                              f"{len(station.queue)} queued.")
+    local = library.resolve(url)
+    if local is not None:
+        url = local.url
+    if station is None:
+        station = stations[name.lower()] = Station(name, ctx.bot.loop)
+    vid = _video_id(url)
+    meta = (await video_meta.fetch([vid])).get(vid)
+    title = local.title if local is not None else (meta or {}).get("title")
+    station.enqueue(Track(url, title, ctx.author.id, (meta or {}).get("duration")))
+    await ctx.send(f"Queued **{title or url}** on **{station.name}**. Listeners can join with `&tune {station.name}`.")
 
-    # start playback
-    vc.stop()
-    base_source = discord.FFmpegPCMAudio(stream_url,before_options=before, options =opts)
-    source = discord.PCMVolumeTransformer(base_source,volume=volume)
-    vc.play(source, after=make_after())
+@bot.command()
+@commands.is_owner()
+async def endbroadcast(ctx, name: str):
+    """Take a station off air; tuned-in guilds go quiet."""
+    station = stations.get(name.lower())
+    if station is None:
+        return await ctx.send(f"There's no station called **{name}**.")
+    station.close()
+    await ctx.send(f"**{station.name}** is off air.")
 
-    await ctx.send(f"Now playing: {current_title}")
+@bot.command()
+async def tune(ctx, name: str):
+    """Listen to a broadcast station in your voice channel (`&play`, `&skip` or `&leave` to stop)."""
+    station = stations.get(name.lower())
+    if station is None:
+        return await ctx.send(f"There's no station called **{name}**. `&broadcast` lists them.")
+    if not ctx.voice_client:
+        await ctx.invoke(join)
+    vc = ctx.voice_client
+    if not vc or not vc.is_connected():
+        return
+    player = get_player(ctx.guild.id)
+    player.generation += 1  # whatever was playing shouldn't advance the queue when it stops
+    if player.watchdog:
+        player.watchdog.cancel()
+        player.watchdog = None
+    player.source = None
+    player.title = player.webpage_url = player.duration = player.thumbnail = None
+    _state_changed(player, queue=False)
+    listener = StationListener(station, ctx.guild.id, ctx.channel)
+    station.listeners.add(listener)
+
+    def _after(error: Exception | None):
+        if error:
+            print(f"[broadcast] listener in {ctx.guild.id} stopped: {error}")
 
-bot.run("INSERT_YOUR_TOKEN_HERE")
+    vc.stop()
+    vc.play(listener, after=_after)
+    now = f": {station.title}" if station.title else ", nothing on air right now"
+    await ctx.send(f"Tuned in to **{station.name}**{now}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Athena music bot")
+    parser.add_argument("--shards", type=int, help="total shard count; runs sharded worker processes")
+    parser.add_argument("--procs", type=int, default=1, help="worker processes to spread the shards over")
+    args = parser.parse_args()
+    if args.shards:
+        sys.exit(launch_shards(args.shards, args.procs))
+    else:
+        bot.run(os.environ.get("DISCORD_BOT_TOKEN", "INSERT_YOUR_TOKEN_HERE"))
+        video_meta.flush()
 
@@ -0,0 +1,512 @@
+"""
+Offline load test for Athena. No Discord, no YouTube: voice clients are fakes that
+read frames off the audio source like discord.py's player thread, yt-dlp is
+swapped for a stub with configurable latency, and "streams" are a local Opus file
+served over loopback HTTP to the real ffmpeg.
+
+    python bench.py --guilds 50 --duration 120
+    python bench.py --guilds 200 --speed 4 --mix play=4,queue=2,skip=1,seek=1,playlist=0.2
+
+Reports event loop lag, time to first audio, inter-track gap, command latency,
+CPU per stream and memory per guild. Needs ffmpeg (with libopus) and discord.py.
+"""
+import argparse
+import asyncio
+import http.server
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from functools import partial
+
+# must be in place before Athena reads its config
+_tmp = tempfile.mkdtemp(prefix="athena-bench-")
+os.environ["ATHENA_EXTRACT_BACKEND"] = "thread"  # the stubbed yt-dlp only exists in this process
+os.environ["ATHENA_CACHE_DB"] = os.path.join(_tmp, "cache.db")
+os.environ.setdefault("ATHENA_STATE_DB", "")
+os.environ.setdefault("ATHENA_AUDIO_CACHE_DIR", "")
+
+import discord
+import Athena as A
+
+FRAME_SECONDS = 0.02
+
+
+# --- audio served over loopback ---
+
+def make_track(directory: str, seconds: float) -> str:
+    """Encode a sine tone to WebM/Opus, like YouTube's audio-only formats."""
+    path = os.path.join(directory, "track.webm")
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-f", "lavfi",
+         "-i", f"sine=frequency=440:duration={seconds:g}:sample_rate=48000",
+         "-ac", "2", "-c:a", "libopus", "-b:a", "128k", path],
+        check=True,
+    )
+    return path
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+def serve(directory: str):
+    """Threaded HTTP server for `directory` on a free loopback port."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- stubbed yt-dlp ---
+
+class FakeYDL:
+    """Answers extract_info() with canned dicts after a simulated network delay."""
+
+    def __init__(self, profile: str, stream_url: str, args):
+        self.profile = profile
+        self.stream_url = stream_url
+        self.args = args
+
+    def _delay(self):
+        time.sleep(max(0.0, random.gauss(self.args.extract_latency, self.args.extract_jitter)))
+
+    def _video(self, vid: str) -> dict:
+        return {
+            "id": vid,
+            "title": f"Bench track {vid}",
+            "duration": self.args.track_seconds,
+            "webpage_url": f"https://www.youtube.com/watch?v={vid}",
+            # expire= keeps Athena's stream cache honest
+            "url": f"{self.stream_url}?id={vid}&expire={int(time.time()) + 6 * 3600}",
+            "http_headers": {"User-Agent": "athena-bench"},
+            "acodec": "opus",
+            "ext": "webm",
+        }
+
+    def _entries(self, count: int):
+        for i in range(count):
+            if i and i % 100 == 0:
+                self._delay()  # next page
+            yield {"id": f"p{i:010d}", "title": f"Playlist entry {i}", "duration": None}
+
+    def extract_info(self, url: str, download: bool = False, process: bool = True, ie_key=None):
+        self._delay()
+        if self.profile == "search":  # ytsearch5 via default_search
+            return {"entries": [self._video(f"s{i:010d}") for i in range(5)]}
+        if "list=" in url:
+            entries = self._entries(self.args.playlist_size)
+            return {"_type": "playlist", "entries": entries if not process else list(entries)}
+        return self._video(A._video_id(url) or url[-11:])
+
+
+# --- fake Discord objects ---
+
+class FakeAudioPlayer(threading.Thread):
+    """discord.py's AudioPlayer loop: one read() per frame, after() when done."""
+
+    def __init__(self, source, after, speed: float):
+        super().__init__(daemon=True, name="bench-audio")
+        self.source = source
+        self.after = after
+        self.delay = FRAME_SECONDS / speed
+        self._end = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+
+    def run(self):
+        error = None
+        try:
+            loops, start = 0, time.perf_counter()
+            while not self._end.is_set():
+                if not self._resumed.is_set():
+                    self._resumed.wait()
+                    loops, start = 0, time.perf_counter()
+                    continue
+                if not self.source.read():
+                    self._end.set()
+                    break
+                loops += 1
+                time.sleep(max(0.0, start + self.delay * loops - time.perf_counter()))
+        except Exception as e:
+            error = e
+            self._end.set()
+        finally:
+            if self.after:
+                try:
+                    self.after(error)
+                except Exception as e:
+                    print(f"after() raised: {e}")
+            self.source.cleanup()
+
+    def stop(self):
+        self._end.set()
+        self._resumed.set()
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def is_playing(self):
+        return self._resumed.is_set() and not self._end.is_set()
+
+    def is_paused(self):
+        return not self._end.is_set() and not self._resumed.is_set()
+
+
+class FakeVoiceClient:
+    def __init__(self, guild, channel, speed: float):
+        self.guild = guild
+        self.channel = channel
+        self.speed = speed
+        self.source = None
+        self._player = None
+        self._connected = True
+
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self._player is not None and self._player.is_playing()
+
+    def is_paused(self):
+        return self._player is not None and self._player.is_paused()
+
+    def play(self, source, *, after=None):
+        if self.is_playing():
+            raise discord.ClientException("Already playing audio.")
+        self.source = source
+        self._player = FakeAudioPlayer(source, after, self.speed)
+        self._player.start()
+
+    def stop(self):
+        if self._player:
+            self._player.stop()
+            self._player = None
+
+    def pause(self):
+        if self._player:
+            self._player.pause()
+
+    def resume(self):
+        if self._player:
+            self._player.resume()
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, *, force: bool = False):
+        self.stop()
+        self._connected = False
+        self.guild.voice_client = None
+
+
+class FakeMessage:
+    def __init__(self, channel, message_id: int):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, **kwargs):
+        self.channel.edited += 1
+        return self
+
+
+class FakeTextChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+        self.sent = self.edited = 0
+        self.last_message_id = None
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+        self.last_message_id = self.sent
+        return FakeMessage(self, self.sent)
+
+    def typing(self):
+        return _NoTyping()
+
+class _NoTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _Perms:
+    connect = speak = True
+
+class FakeVoiceChannel:
+    def __init__(self, guild, channel_id: int, speed: float):
+        self.guild = guild
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+        self.members = []
+        self.speed = speed
+
+    def permissions_for(self, member):
+        return _Perms()
+
+    async def connect(self, **kwargs):
+        await asyncio.sleep(0.05)  # voice handshake
+        self.guild.voice_client = FakeVoiceClient(self.guild, self, self.speed)
+        return self.guild.voice_client
+
+
+class FakeMember:
+    def __init__(self, user_id: int, voice_channel=None, bot: bool = False):
+        self.id = user_id
+        self.bot = bot
+        self.display_name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.voice = type("VoiceState", (), {"channel": voice_channel})() if voice_channel else None
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, speed: float):
+        self.id = guild_id
+        self.name = f"bench-{guild_id}"
+        self.me = FakeMember(0, bot=True)
+        self.voice_client = None
+        self.voice_channel = FakeVoiceChannel(self, guild_id * 10 + 1, speed)
+        self.text_channel = FakeTextChannel(guild_id * 10 + 2)
+        self.listener = FakeMember(guild_id * 10 + 3, self.voice_channel)
+        self.voice_channel.members.append(self.listener)
+
+    def get_member(self, user_id: int):
+        return self.listener if user_id == self.listener.id else None
+
+
+class FakeBot:
+    def __init__(self, loop, guilds):
+        self.loop = loop
+        self.guilds = guilds
+        self._by_id = {g.id: g for g in guilds}
+
+    def get_guild(self, guild_id):
+        return self._by_id.get(guild_id)
+
+    @property
+    def voice_clients(self):
+        return [g.voice_client for g in self.guilds if g.voice_client]
+
+
+# --- measurements ---
+
+def pct(values, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def fmt_ms(sec) -> str:
+    return "-" if sec is None else f"{sec * 1000:.1f}ms"
+
+def rss_bytes() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def child_cpu_seconds() -> float:
+    """CPU used by our children: finished ones (rusage) plus live ones (/proc)."""
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    total = ru.ru_utime + ru.ru_stime
+    ticks = os.sysconf("SC_CLK_TCK")
+    me = os.getpid()
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        fields = stat[stat.rfind(")") + 2:].split()
+        if int(fields[1]) == me:
+            total += (int(fields[11]) + int(fields[12])) / ticks
+    return total
+
+async def watch_loop(lags: list, streams: list, bot: FakeBot, stop: asyncio.Event):
+    """Sample event loop lag every 50 ms and concurrent streams every 0.5 s."""
+    interval, n = 0.05, 0
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - t - interval))
+        n += 1
+        if n % 10 == 0:
+            streams.append(sum(1 for vc in bot.voice_clients if vc.is_playing()))
+
+
+# --- load ---
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"play", "queue", "skip", "seek", "playlist", "search"}
+    if unknown:
+        raise SystemExit(f"unknown commands in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+async def guild_session(ctx, rng: random.Random, args, mix: dict, deadline: float, results: dict):
+    names, weights = list(mix), list(mix.values())
+    await ctx.invoke(A.join)
+    await ctx.invoke(A.play, url=f"https://www.youtube.com/watch?v=v{rng.randrange(args.videos):010d}")
+    while time.monotonic() < deadline:
+        await asyncio.sleep(rng.expovariate(1.0 / args.interval))
+        cmd = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            if cmd == "play":
+                await ctx.invoke(A.play, url=f"https://www.youtube.com/watch?v=v{rng.randrange(args.videos):010d}")
+            elif cmd == "queue":
+                await ctx.invoke(A.queue)
+            elif cmd == "skip":
+                await ctx.invoke(A.skip)
+            elif cmd == "seek":
+                await ctx.invoke(A.seek, position=rng.choice(["+10", "+30", "-10", "0:15"]))
+            elif cmd == "search":
+                await ctx.invoke(A.search, query=f"bench query {rng.randrange(50)}")
+            elif cmd == "playlist":
+                url = f"https://www.youtube.com/playlist?list=PLbench{rng.randrange(5)}"
+                await ctx.invoke(A.playlist, url=url, limit=args.playlist_size)
+        except Exception as e:
+            results["errors"][f"{cmd}: {type(e).__name__}"] += 1
+        results["commands"][cmd].append(time.perf_counter() - started)
+
+async def run(args) -> dict:
+    if args.speed < 1:
+        raise SystemExit("--speed must be >= 1 (slower than real time looks like a stall to Athena)")
+    if not shutil.which("ffmpeg"):
+        raise SystemExit("ffmpeg not found on PATH")
+    make_track(_tmp, args.track_seconds)
+    server = serve(_tmp)
+    stream_url = f"http://127.0.0.1:{server.server_address[1]}/track.webm"
+    A._get_ydl = lambda profile: FakeYDL(profile, stream_url, args)
+
+    # keep the raw samples Athena reports, not just its bucketed histograms
+    samples = defaultdict(list)
+    observe = A.metrics.observe
+    def record(name, value, **labels):
+        samples[name].append(value)
+        observe(name, value, **labels)
+    A.metrics.observe = record
+
+    loop = asyncio.get_running_loop()
+    rss_before = rss_bytes()
+    guilds = [FakeGuild(i + 1, args.speed) for i in range(args.guilds)]
+    bot = FakeBot(loop, guilds)
+    mix = parse_mix(args.mix)
+    results = {"commands": defaultdict(list), "errors": defaultdict(int)}
+    lags, streams = [], []
+    stop = asyncio.Event()
+    watcher = loop.create_task(watch_loop(lags, streams, bot, stop))
+
+    cpu_start, children_start, wall_start = time.process_time(), child_cpu_seconds(), time.monotonic()
+    deadline = wall_start + args.duration
+    sessions = []
+    for g in guilds:
+        ctx = A._ResumeContext(bot, g, g.text_channel, g.listener)
+        rng = random.Random(args.seed * 100003 + g.id)
+        sessions.append(loop.create_task(guild_session(ctx, rng, args, mix, deadline, results)))
+        await asyncio.sleep(args.ramp / max(1, args.guilds))
+    await asyncio.wait(sessions, timeout=args.duration + 30)
+    wall = time.monotonic() - wall_start
+    cpu_py, cpu_ff = time.process_time() - cpu_start, child_cpu_seconds() - children_start
+    rss_after = rss_bytes()
+    stop.set()
+    await watcher
+
+    for g in guilds:
+        if g.voice_client:
+            await g.voice_client.disconnect()
+    for task in sessions:
+        task.cancel()
+    await asyncio.sleep(0.5)  # let player threads run after() and reap ffmpeg
+    server.shutdown()
+
+    avg_streams = sum(streams) / len(streams) if streams else 0.0
+    tracks = len(samples["time_to_first_audio_seconds"]) + len(samples["inter_track_gap_seconds"])
+    chat_calls = sum(g.text_channel.sent + g.text_channel.edited for g in guilds)
+    stream_seconds = max(avg_streams * wall, 1e-9)
+    return {
+        "guilds": args.guilds,
+        "seconds": round(wall, 1),
+        "speed": args.speed,
+        "playback_mode": A.PLAYBACK_MODE,
+        "avg_concurrent_streams": round(avg_streams, 1),
+        "loop_lag": {"p50": pct(lags, 0.5), "p99": pct(lags, 0.99), "max": max(lags, default=None)},
+        "time_to_first_audio": {"p50": pct(samples["time_to_first_audio_seconds"], 0.5),
+                                "p95": pct(samples["time_to_first_audio_seconds"], 0.95),
+                                "n": len(samples["time_to_first_audio_seconds"])},
+        "inter_track_gap": {"p50": pct(samples["inter_track_gap_seconds"], 0.5),
+                            "p95": pct(samples["inter_track_gap_seconds"], 0.95),
+                            "n": len(samples["inter_track_gap_seconds"])},
+        "ffmpeg_spawn": {"p50": pct(samples["ffmpeg_spawn_seconds"], 0.5),
+                         "p95": pct(samples["ffmpeg_spawn_seconds"], 0.95)},
+        "commands": {cmd: {"p50": pct(v, 0.5), "p95": pct(v, 0.95), "n": len(v)}
+                     for cmd, v in sorted(results["commands"].items())},
+        "cpu_per_stream": {"athena": cpu_py / stream_seconds, "ffmpeg": cpu_ff / stream_seconds},
+        "memory_per_guild_bytes": (rss_after - rss_before) / max(1, args.guilds),
+        "chat_calls_per_track": chat_calls / max(1, tracks),
+        "errors": dict(results["errors"]),
+    }
+
+def report(r: dict):
+    print(f"\n{r['guilds']} guilds, {r['seconds']}s at {r['speed']:g}x, {r['playback_mode']} mode, "
+          f"{r['avg_concurrent_streams']} streams on average")
+    lag = r["loop_lag"]
+    print(f"  event loop lag       p50 {fmt_ms(lag['p50'])}  p99 {fmt_ms(lag['p99'])}  max {fmt_ms(lag['max'])}")
+    for key, label in (("time_to_first_audio", "time to first audio"), ("inter_track_gap", "inter-track gap")):
+        h = r[key]
+        print(f"  {label:<20} p50 {fmt_ms(h['p50'])}  p95 {fmt_ms(h['p95'])}  ({h['n']})")
+    print(f"  ffmpeg spawn         p50 {fmt_ms(r['ffmpeg_spawn']['p50'])}  p95 {fmt_ms(r['ffmpeg_spawn']['p95'])}")
+    for cmd, h in r["commands"].items():
+        print(f"  &{cmd:<19} p50 {fmt_ms(h['p50'])}  p95 {fmt_ms(h['p95'])}  ({h['n']})")
+    cpu = r["cpu_per_stream"]
+    print(f"  CPU per stream       {cpu['athena']:.1%} athena + {cpu['ffmpeg']:.1%} ffmpeg (of one core)")
+    print(f"  memory per guild     {r['memory_per_guild_bytes'] / 1024:.0f} KiB RSS")
+    print(f"  chat API calls       {r['chat_calls_per_track']:.2f} per track")
+    if r["errors"]:
+        print("  errors: " + ", ".join(f"{k} x{v}" for k, v in sorted(r["errors"].items())))
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Athena load test")
+    parser.add_argument("--guilds", type=int, default=20, help="simulated guilds")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of load")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which guilds start")
+    parser.add_argument("--speed", type=float, default=1.0, help="frame read pace (1 = real time)")
+    parser.add_argument("--interval", type=float, default=8.0, help="mean seconds between a guild's commands")
+    parser.add_argument("--mix", default="play=4,queue=2,skip=1,seek=1,playlist=0.2",
+                        help="command weights, e.g. play=4,queue=2,skip=1,seek=1,playlist=0.2,search=1")
+    parser.add_argument("--track-seconds", type=float, default=30.0, help="length of the generated track")
+    parser.add_argument("--videos", type=int, default=200, help="distinct video ids to pick from")
+    parser.add_argument("--playlist-size", type=int, default=50)
+    parser.add_argument("--extract-latency", type=float, default=0.3, help="mean stub yt-dlp latency (s)")
+    parser.add_argument("--extract-jitter", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results here")
+    args = parser.parse_args()
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(_tmp, ignore_errors=True)
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()